@@ -0,0 +1,96 @@
+from __future__ import division
+
+class AliasTable(object):
+    """
+    Walker/Vose alias table over values with probabilities probs.
+
+    Built once in O(n), a draw then costs a single uniform and one
+    comparison. Probabilities are validated when the table is built:
+    they must be non-negative and sum to 1 within tolerance. A table
+    with a single possible value returns it without drawing.
+    """
+
+    __slots__ = ('values', 'n', 'prob', 'alias', 'single')
+
+    def __init__(self, values, probs, tolerance=1e-9):
+        values, probs = list(values), [float(p) for p in probs]
+        if len(values) != len(probs) or not values:
+            raise ValueError("Need one probability per value, got %d values and %d probabilities."
+                             % (len(values), len(probs)))
+        if min(probs) < -tolerance:
+            raise ValueError("Probabilities must be non-negative: %r." % (probs,))
+        if abs(sum(probs) - 1.0) > tolerance:
+            raise ValueError("Probabilities must sum to 1, not %r: %r." % (sum(probs), probs))
+        probs = [max(p, 0.0) for p in probs]
+
+        self.values = values
+        self.n = len(values)
+        possible = [i for i, p in enumerate(probs) if p > 0.0]
+        self.single = values[possible[0]] if len(possible) == 1 else None
+
+        total = sum(probs)
+        scaled = [p * self.n / total for p in probs]
+        self.prob = [1.0] * self.n
+        self.alias = list(range(self.n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] = (scaled[l] + scaled[s]) - 1.0
+            if scaled[l] < 1.0:
+                small.append(l)
+            else:
+                large.append(l)
+        # leftovers are 1 up to rounding
+
+    def draw(self, rng):
+        if self.single is not None:
+            return self.single
+        u = rng.random() * self.n
+        i = int(u)
+        if i == self.n:
+            i -= 1
+        if u - i < self.prob[i]:
+            return self.values[i]
+        return self.values[self.alias[i]]
+
+def routing_tables(network):
+    """
+    Returns tables[station][clss] drawing the index of the next station,
+    number_of_stations meaning exit, from the transition matrices.
+    """
+    tables = []
+    for station in range(network.number_of_stations):
+        station_tables = []
+        for clss in range(network.number_of_classes):
+            row = network.patients[clss].transition_mat[station]
+            if len(row) != network.number_of_stations:
+                raise ValueError("Transition row of station %d, class %d has %d entries for %d stations."
+                                 % (station + 1, clss, len(row), network.number_of_stations))
+            if sum(row) > 1.0 + 1e-9:
+                raise ValueError("Transition row of station %d, class %d sums to more than 1: %r."
+                                 % (station + 1, clss, row))
+            station_tables.append(AliasTable(range(network.number_of_stations + 1),
+                                             list(row) + [max(1.0 - sum(row), 0.0)]))
+        tables.append(station_tables)
+    return tables
+
+def class_change_tables(network):
+    """
+    Returns tables[station][clss] drawing the new class of a patient
+    of class clss at station, or None for stations without class change.
+    """
+    tables = []
+    for station in network.stations:
+        if not station.class_change_matrix:
+            tables.append(None)
+            continue
+        try:
+            tables.append([AliasTable(range(network.number_of_classes), row)
+                           for row in station.class_change_matrix])
+        except ValueError as error:
+            raise ValueError("Class change matrix of station %d: %s"
+                             % (len(tables) + 1, error))
+    return tables
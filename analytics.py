@@ -0,0 +1,202 @@
+from __future__ import division
+
+from math import isinf
+from functools import partial
+
+def exponential_rate(dist):
+    """
+    Rate of an Exponential spec, 0 for NoArrivals, None otherwise.
+    """
+    if dist == 'NoArrivals':
+        return 0.0
+    if dist[0] == 'Exponential':
+        return float(dist[1])
+    return None
+
+def distribution_name(dist):
+    return dist if dist == 'NoArrivals' else dist[0]
+
+def qualification(network):
+    """
+    Returns the reasons why network is not an open product-form
+    (Jackson / BCMP FCFS) network; an empty list means it qualifies.
+    """
+    reasons = []
+    if network.priority_lev > 1:
+        reasons.append("priority classes change waits per class")
+    for clss, patient in enumerate(network.patients):
+        for station in range(network.number_of_stations):
+            if exponential_rate(patient.arrival_dist[station]) is None:
+                reasons.append("class %d arrivals at station %d are %s, not Exponential"
+                               % (clss, station + 1, distribution_name(patient.arrival_dist[station])))
+            if patient.service_dist[station] == 'NoArrivals' or exponential_rate(patient.service_dist[station]) is None:
+                reasons.append("class %d service at station %d is %s, not Exponential"
+                               % (clss, station + 1, distribution_name(patient.service_dist[station])))
+    for station in range(network.number_of_stations):
+        rates = set(exponential_rate(patient.service_dist[station]) for patient in network.patients)
+        if len(rates) > 1 and None not in rates:
+            reasons.append("service rates at station %d differ between classes (%s)"
+                           % (station + 1, ', '.join('%g' % rate for rate in sorted(rates))))
+        if not isinf(network.stations[station].queue_capacity):
+            reasons.append("station %d has a finite queue capacity (%g)"
+                           % (station + 1, network.stations[station].queue_capacity))
+    if not reasons and not any(exponential_rate(patient.arrival_dist[station])
+                               for patient in network.patients
+                               for station in range(network.number_of_stations)):
+        reasons.append("there are no arrivals")
+    return reasons
+
+def solve_linear(matrix, vector):
+    """
+    Solves matrix x = vector by Gaussian elimination with partial
+    pivoting; returns None if matrix is singular.
+    """
+    n = len(vector)
+    rows = [list(matrix[i]) + [vector[i]] for i in range(n)]
+    for column in range(n):
+        pivot = max(range(column, n), key=lambda row: abs(rows[row][column]))
+        if abs(rows[pivot][column]) < 1e-12:
+            return None
+        rows[column], rows[pivot] = rows[pivot], rows[column]
+        for row in range(column + 1, n):
+            factor = rows[row][column] / rows[column][column]
+            if factor:
+                for k in range(column, n + 1):
+                    rows[row][k] -= factor * rows[column][k]
+    x = [0.0] * n
+    for row in range(n - 1, -1, -1):
+        x[row] = (rows[row][n] - sum(rows[row][k] * x[k] for k in range(row + 1, n))) / rows[row][row]
+    return x
+
+def traffic_equations(network):
+    """
+    Solves the traffic equations of an open network over (station,
+    class) pairs and returns {(station, clss): arrival rate}, stations
+    numbered from 1 and clss being the class on arrival at the station.
+
+    A class changes at the end of a service, before routing, and the
+    patient is then routed with its new class's transition matrix.
+    Returns None if patients can never leave.
+    """
+    stations, classes = network.number_of_stations, network.number_of_classes
+    n = stations * classes
+    index = lambda station, clss: station * classes + clss
+
+    # matrix = I - P^T, P[(i, c) -> (j, d)] = C_i[c][d] T_d[i][j]
+    matrix = [[1.0 if row == column else 0.0 for column in range(n)] for row in range(n)]
+    external = [0.0] * n
+    for i in range(stations):
+        class_change = network.stations[i].class_change_matrix
+        for c in range(classes):
+            external[index(i, c)] = exponential_rate(network.patients[c].arrival_dist[i]) or 0.0
+            for d in range(classes):
+                change = class_change[c][d] if class_change else (1.0 if c == d else 0.0)
+                if not change:
+                    continue
+                for j in range(stations):
+                    matrix[index(j, d)][index(i, c)] -= change * network.patients[d].transition_mat[i][j]
+    rates = solve_linear(matrix, external)
+    if rates is None:
+        return None
+    return {(i + 1, c): max(rates[index(i, c)], 0.0) for i in range(stations) for c in range(classes)}
+
+def erlang_c(servers, arrival_rate, service_rate):
+    """
+    M/M/c results: utilisation, probability of waiting (Erlang C),
+    mean number waiting and present, mean wait and mean time in station.
+    servers may be Inf (M/M/inf). Needs utilisation < 1.
+    """
+    offered = arrival_rate / service_rate
+    if isinf(servers):
+        return {'utilisation': None, 'probability_of_waiting': 0.0, 'mean_queue_length': 0.0,
+                'mean_patients': offered, 'mean_wait': 0.0, 'mean_time_in_station': 1.0 / service_rate}
+    utilisation = offered / servers
+    if utilisation >= 1.0:
+        raise ValueError("Station is unstable: utilisation %g >= 1." % utilisation)
+    # Erlang B by recursion, then C from B; stable for large servers
+    erlang_b = 1.0
+    for k in range(1, int(servers) + 1):
+        erlang_b = offered * erlang_b / (k + offered * erlang_b)
+    probability_of_waiting = erlang_b / (1.0 - utilisation * (1.0 - erlang_b))
+    mean_queue_length = probability_of_waiting * utilisation / (1.0 - utilisation)
+    mean_wait = mean_queue_length / arrival_rate if arrival_rate else 0.0
+    return {'utilisation': utilisation,
+            'probability_of_waiting': probability_of_waiting,
+            'mean_queue_length': mean_queue_length,
+            'mean_patients': mean_queue_length + offered,
+            'mean_wait': mean_wait,
+            'mean_time_in_station': mean_wait + 1.0 / service_rate}
+
+def analyse(network):
+    """
+    Closed-form steady-state KPIs of an open product-form network:
+    {'stations': {station: erlang_c results plus 'arrival_rate' and
+    'class_arrival_rates'}, 'network': {'throughput', 'mean_patients',
+    'mean_sojourn_time'}}. Raises ValueError with the reasons when the
+    network does not qualify or is unstable.
+    """
+    reasons = qualification(network)
+    if reasons:
+        raise ValueError("Network is not an open product-form network: %s." % '; '.join(reasons))
+    rates = traffic_equations(network)
+    if rates is None:
+        raise ValueError("Traffic equations have no solution: patients can never leave the network.")
+
+    stations, unstable = {}, []
+    for i in range(network.number_of_stations):
+        station_rates = {c: rates[i + 1, c] for c in range(network.number_of_classes)}
+        arrival_rate = sum(station_rates.values())
+        service_rate = next(exponential_rate(patient.service_dist[i]) for patient in network.patients)
+        servers = network.stations[i].number_of_servers
+        if not isinf(servers) and arrival_rate >= servers * service_rate:
+            unstable.append("station %d (utilisation %g)" % (i + 1, arrival_rate / (servers * service_rate)))
+            continue
+        kpis = erlang_c(servers, arrival_rate, service_rate)
+        kpis['arrival_rate'] = arrival_rate
+        kpis['class_arrival_rates'] = station_rates
+        stations[i + 1] = kpis
+    if unstable:
+        raise ValueError("Network is unstable at %s." % ', '.join(unstable))
+
+    throughput = sum(exponential_rate(patient.arrival_dist[i]) or 0.0
+                     for patient in network.patients for i in range(network.number_of_stations))
+    mean_patients = sum(kpis['mean_patients'] for kpis in stations.values())
+    return {'stations': stations,
+            'network': {'throughput': throughput,
+                        'mean_patients': mean_patients,
+                        'mean_sojourn_time': mean_patients / throughput}}
+
+def analytic_metrics(network):
+    """
+    The analytic counterparts of replication.default_metrics.
+    """
+    metrics = {}
+    for station, kpis in analyse(network)['stations'].items():
+        metrics['mean_wait_%d' % station] = kpis['mean_wait']
+        if kpis['utilisation'] is not None:
+            metrics['utilisation_%d' % station] = kpis['utilisation']
+    return metrics
+
+def cross_check(network, max_simulation_time, replications=10, warmup=0.0, seed=0, processes=None):
+    """
+    Replicates network (see replication.replicate) and compares the
+    simulated mean waits and utilisations with the analytic ones.
+    Returns one row per metric: analytic and simulated values, the
+    simulated 95% half-width, their difference and whether the analytic
+    value lies within the confidence interval.
+    """
+    from replication import replicate, default_metrics
+    analytic = analytic_metrics(network)
+    simulated = replicate(network, max_simulation_time, replications, seed=seed, processes=processes,
+                          metrics=partial(default_metrics, warmup=warmup)).summary
+    rows = []
+    for metric in sorted(analytic):
+        statistics = simulated.get(metric, {'mean': float('nan'), 'half_width': float('nan')})
+        difference = statistics['mean'] - analytic[metric]
+        rows.append({'metric': metric,
+                     'analytic': analytic[metric],
+                     'simulated': statistics['mean'],
+                     'half_width': statistics['half_width'],
+                     'difference': difference,
+                     'within': abs(difference) <= statistics['half_width']})
+    return rows
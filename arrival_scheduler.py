@@ -0,0 +1,38 @@
+from __future__ import division
+
+from heapq import heappush, heappop, heapreplace
+
+class ArrivalScheduler(object):
+    """
+    Min-heap of the next arrival date of every (station, class) source.
+
+    Entries are (date, station, clss), so simultaneous arrivals are taken
+    in station order, then class order. Sources with no further arrivals
+    (date Inf) are never stored.
+    """
+
+    def __init__(self):
+        self.heap = []
+
+    def schedule(self, date, station, clss):
+        if date != float('Inf'):
+            heappush(self.heap, (date, station, clss))
+
+    def reschedule_next(self, date):
+        """
+        Replaces the source at the top of the heap, which has just
+        fired, with its next arrival date.
+        """
+        _, station, clss = self.heap[0]
+        if date != float('Inf'):
+            heapreplace(self.heap, (date, station, clss))
+        else:
+            heappop(self.heap)
+
+    def next_arrival(self):
+        """
+        Returns (date, station, clss) of the earliest arrival.
+        """
+        if self.heap:
+            return self.heap[0]
+        return float('Inf'), 1, 0
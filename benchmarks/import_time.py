@@ -0,0 +1,65 @@
+"""
+Startup benchmark: imports the core (simulation.py) in fresh interpreters
+and checks that it stays light. Exits non-zero if a heavy or CLI-only
+module is pulled in, or if the median import takes longer than --budget.
+
+    python benchmarks/import_time.py [--repeat 10] [--budget 0.1]
+"""
+from __future__ import division
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+PACKAGE_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# must not be imported by the core
+FORBIDDEN = ['argparse', 'tqdm', 'matplotlib', 'numpy', 'yaml', 'pdb', 'multiprocessing']
+
+PROBE = """
+import sys, time, json
+start = time.perf_counter()
+import %s
+elapsed = time.perf_counter() - start
+print(json.dumps({'seconds': elapsed, 'modules': sorted(sys.modules)}))
+"""
+
+def cold_import(module):
+    """
+    Imports module in a new interpreter, returning the import time in
+    seconds and the modules it left in sys.modules.
+    """
+    output = subprocess.check_output([sys.executable, '-c', PROBE % module], cwd=PACKAGE_DIRECTORY)
+    result = json.loads(output.decode())
+    return result['seconds'], result['modules']
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--module', type=str, default='simulation')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--budget', type=float, default=0.1, help='median seconds allowed')
+    args = parser.parse_args(argv)
+
+    times = []
+    for _ in range(args.repeat):
+        seconds, modules = cold_import(args.module)
+        times.append(seconds)
+    times.sort()
+    median = times[len(times) // 2]
+    heavy = sorted(set(name.split('.')[0] for name in modules) & set(FORBIDDEN))
+
+    print('import %s: median %.1f ms, min %.1f ms, max %.1f ms over %d runs, %d modules loaded'
+          % (args.module, 1000 * median, 1000 * times[0], 1000 * times[-1], len(times), len(modules)))
+    failed = False
+    if heavy:
+        print('FAIL: import %s pulls in %s' % (args.module, ', '.join(heavy)))
+        failed = True
+    if median > args.budget:
+        print('FAIL: median import time above the %.0f ms budget' % (1000 * args.budget))
+        failed = True
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,203 @@
+"""
+Benchmark suite over scaled versions of the example cases.
+
+Every workload runs in a fresh interpreter (so peak memory is its own),
+seeded, so event counts are the same from run to run. Reports events
+per second, wall time, peak memory and records per second written to
+csv and to columns, and compares events per second with a baseline.
+
+    python benchmarks/suite.py [--repeat 3] [--workloads basic_3_x10 tandem_10x3]
+    python benchmarks/suite.py --save benchmarks/baseline.json
+    python benchmarks/suite.py --compare benchmarks/baseline.json [--tolerance 0.15]
+"""
+from __future__ import division
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+from time import perf_counter
+
+PACKAGE_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PACKAGE_DIRECTORY)
+
+def scale_distribution(dist, load):
+    """
+    Multiplies the rate of an arrival distribution by load.
+    """
+    if dist == 'NoArrivals' or load == 1:
+        return dist
+    if dist[0] == 'Exponential':
+        return ['Exponential', dist[1] * load]
+    if dist[0] in ('Deterministic', 'Uniform'):
+        return [dist[0]] + [value / load for value in dist[1:]]
+    raise ValueError("Cannot scale %r." % (dist,))
+
+def scale(params, servers=1, load=1):
+    """
+    Returns create_network parameters with servers times the servers
+    and load times the arrival rates of params.
+    """
+    params = dict(params)
+    arrivals = params['Arrival_distributions']
+    if isinstance(arrivals, dict):
+        params['Arrival_distributions'] = {clss: [scale_distribution(dist, load) for dist in dists]
+                                           for clss, dists in arrivals.items()}
+    else:
+        params['Arrival_distributions'] = [scale_distribution(dist, load) for dist in arrivals]
+    params['Number_of_servers'] = [n if n == 'Inf' else n * servers for n in params['Number_of_servers']]
+    return params
+
+def tandem(stations, classes, servers=2, utilisation=0.8):
+    """
+    A line of stations visited in order, every class arriving at the
+    first one, with a tenth of the patients sent back one station.
+    """
+    service_rate = 1.0
+    arrival_rate = utilisation * servers * service_rate * 0.9 / classes
+    transitions = [[0.0] * stations for _ in range(stations)]
+    for station in range(stations - 1):
+        transitions[station][station + 1] = 0.9
+        if station > 0:
+            transitions[station][station - 1] = 0.1
+    return dict(
+        Arrival_distributions={'Class %d' % clss: [['Exponential', arrival_rate]] + ['NoArrivals'] * (stations - 1)
+                               for clss in range(classes)},
+        Service_distributions={'Class %d' % clss: [['Exponential', service_rate]] * stations
+                               for clss in range(classes)},
+        Transition_matrices={'Class %d' % clss: transitions for clss in range(classes)},
+        Number_of_servers=[servers] * stations)
+
+def workloads():
+    """
+    Returns {name: (create_network parameters, horizon)}.
+    """
+    from examples import CASES
+    return {
+        'basic_3_x10': (scale(CASES['basic_3'][0], servers=10, load=10), 20 * 1440),
+        'basic_4_heavy': (scale(CASES['basic_4'][0], load=1.9), 80 * 1640),
+        'homo_class_with_transition_x5': (scale(CASES['homo_class_with_transition'][0], servers=5, load=5), 8000),
+        'hetero_class_with_transition_x5': (scale(CASES['hetero_class_with_transition'][0], servers=5, load=5), 1200),
+        'priority_long': (CASES['priority'][0], 4000.0),
+        'class_change_long': (CASES['class_change'][0], 10000.0),
+        'tandem_10x3': (tandem(10, 3), 6000),
+    }
+
+def run_workload(name, seed=0):
+    """
+    Runs one workload in this process and returns its measurements.
+    """
+    import random
+    import resource
+    from params_to_network import create_network
+    from simulation import Simulation
+    from telemetry import Telemetry
+
+    params, horizon = workloads()[name]
+    samples = []
+    Q = Simulation(create_network(**params), rng=random.Random(seed))
+    start = perf_counter()
+    Q.simulate_until_max_time(horizon, telemetry=Telemetry(callback=samples.append,
+                                                           interval=float('Inf'), poll=1 << 20))
+    wall = perf_counter() - start
+    events = samples[-1]['events']
+    records = len(Q.records)
+
+    directory = tempfile.mkdtemp()
+    try:
+        start = perf_counter()
+        Q.write_records_to_file(os.path.join(directory, 'records.csv'))
+        csv_wall = perf_counter() - start
+        start = perf_counter()
+        Q.write_records_to_columns(os.path.join(directory, 'columns'))
+        columns_wall = perf_counter() - start
+    finally:
+        shutil.rmtree(directory)
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {'events': events,
+            'records': records,
+            'wall_time': wall,
+            'events_per_second': events / wall,
+            'peak_memory_mb': peak / 1024 if sys.platform != 'darwin' else peak / 1024 ** 2,
+            'csv_records_per_second': records / csv_wall if csv_wall else float('nan'),
+            'columns_records_per_second': records / columns_wall if columns_wall else float('nan')}
+
+def measure(name, repeat, seed):
+    """
+    Runs a workload repeat times, each in a fresh interpreter, keeping
+    the fastest run.
+    """
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, os.path.abspath(__file__),
+                                          '--one', name, '--seed', str(seed)], cwd=PACKAGE_DIRECTORY)
+        runs.append(json.loads(output.decode()))
+    best = min(runs, key=lambda run: run['wall_time'])
+    best['peak_memory_mb'] = max(run['peak_memory_mb'] for run in runs)
+    return best
+
+def compare(results, baseline, tolerance):
+    """
+    Returns the lines reporting events per second against baseline and
+    whether any workload regressed by more than tolerance.
+    """
+    lines, regressed = [], False
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            continue
+        before = baseline[name]
+        if result['events'] != before['events']:
+            lines.append('%s: %d events, baseline had %d (model or random stream changed)'
+                         % (name, result['events'], before['events']))
+        change = result['events_per_second'] / before['events_per_second'] - 1
+        flag = ''
+        if change < -tolerance:
+            flag, regressed = '  REGRESSION', True
+        lines.append('%-34s %10.0f -> %10.0f events/s (%+.1f%%)%s'
+                     % (name, before['events_per_second'], result['events_per_second'], 100 * change, flag))
+    return lines, regressed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark suite over scaled example cases')
+    parser.add_argument('--workloads', nargs='*', default=None)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', type=str, default=None, help='write the results as a baseline json')
+    parser.add_argument('--compare', type=str, default=None, help='baseline json to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help='slowdown in events per second reported as a regression')
+    parser.add_argument('--one', type=str, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.one is not None:
+        print(json.dumps(run_workload(args.one, args.seed)))
+        return 0
+
+    names = args.workloads or sorted(workloads())
+    results = {}
+    print('%-34s %10s %9s %12s %8s %12s %12s' % ('workload', 'events', 'wall s', 'events/s',
+                                                  'peak MB', 'csv rec/s', 'npy rec/s'))
+    for name in names:
+        result = results[name] = measure(name, args.repeat, args.seed)
+        print('%-34s %10d %9.3f %12.0f %8.1f %12.0f %12.0f' % (
+            name, result['events'], result['wall_time'], result['events_per_second'],
+            result['peak_memory_mb'], result['csv_records_per_second'],
+            result['columns_records_per_second']))
+
+    if args.save:
+        with open(args.save, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare, 'r') as baseline_file:
+            lines, regressed = compare(results, json.load(baseline_file), args.tolerance)
+        print('')
+        print('\n'.join(lines))
+        return 1 if regressed else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,211 @@
+"""
+Command line entry point. The simulation modules never parse arguments
+or import plotting and progress-bar packages themselves; this one does,
+and only for the subcommand being run.
+
+    python cli.py run --case basic_3 [--plot] [--path all_records.csv]
+    python cli.py replicate --case basic_4 --replications 10 --processes 4
+    python cli.py sweep --case basic_3 --grid '{"Number_of_servers": [[3], [4]]}'
+    python cli.py export all_records.csv columns/
+    python cli.py analyse --case basic_3 [--check --replications 10]
+"""
+from __future__ import division
+
+import json
+import argparse
+
+def network_parser():
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--case', type=str, default='class_change',
+                        help='example case of examples.py')
+    parser.add_argument('--params', type=str, default=None,
+                        help='json file of create_network keyword arguments, instead of --case')
+    parser.add_argument('--horizon', type=float, default=None,
+                        help='max_simulation_time (default: that of --case)')
+    return parser
+
+def load_params(args):
+    """
+    Returns the create_network parameters and horizon of --params or --case.
+    """
+    from examples import CASES
+    if args.params is not None:
+        with open(args.params, 'r') as params_file:
+            params = json.load(params_file)
+        horizon = None
+    else:
+        if args.case not in CASES:
+            raise SystemExit("Unknown case %r, choose from %s." % (args.case, ', '.join(sorted(CASES))))
+        params, horizon = CASES[args.case]
+    horizon = args.horizon if args.horizon is not None else horizon
+    if horizon is None:
+        raise SystemExit("--horizon is needed with --params.")
+    return params, horizon
+
+def write_summary(summary, output):
+    """
+    Prints {metric: statistics} and writes it as json to output, if given.
+    """
+    for metric in sorted(summary):
+        statistics = summary[metric]
+        print('%-20s n=%-4d mean=%.6g half_width=%.3g' % (
+            metric, statistics['n'], statistics['mean'], statistics['half_width']))
+    if output:
+        with open(output, 'w') as output_file:
+            json.dump(summary, output_file, indent=2)
+
+def run(args):
+    """
+    Runs an example case as the former simulation.py script did, or one
+    run of --params, and writes its records to --path.
+    """
+    from examples import RUNS
+    if args.params is None and args.horizon is None:
+        if args.case not in RUNS:
+            raise SystemExit("Unknown case %r, choose from %s." % (args.case, ', '.join(sorted(RUNS))))
+        Q = RUNS[args.case](plot=args.plot, progress_bar=args.progress)
+    else:
+        import random
+        from params_to_network import create_network
+        from simulation import Simulation
+        params, horizon = load_params(args)
+        random.seed(args.seed)
+        Q = Simulation(create_network(**params))
+        Q.simulate_until_max_time(horizon, progress_bar=args.progress)
+        if args.plot:
+            import matplotlib.pyplot as plt
+            plt.hist([r.waiting_time for r in Q.get_all_records()])
+            plt.show()
+    if args.write_csv:
+        Q.write_records_to_file(args.path)
+
+def replicate(args):
+    from params_to_network import create_network
+    from replication import replicate as run_replications
+    params, horizon = load_params(args)
+    cache = None
+    if args.cache:
+        from result_cache import ResultCache
+        cache = ResultCache(args.cache)
+    R = run_replications(create_network(**params), horizon, args.replications,
+                         seed=args.seed, processes=args.processes, cache=cache)
+    write_summary(R.summary, args.output)
+
+def sweep(args):
+    from sweep import sweep as run_sweep
+    params, horizon = load_params(args)
+    cache = None
+    if args.cache:
+        from result_cache import ResultCache
+        cache = ResultCache(args.cache)
+    S = run_sweep(params, horizon, args.replications,
+                  grid=json.loads(args.grid) if args.grid else None,
+                  overrides=json.loads(args.overrides) if args.overrides else None,
+                  seed=args.seed, processes=args.processes, objective=args.objective,
+                  minimise=not args.maximise, cache=cache)
+    for row in S.table():
+        if args.objective is None or row['metric'] == args.objective:
+            print(' '.join('%s=%s' % (name, row[name]) for name in S.parameters),
+                  '%s mean=%.6g half_width=%.3g%s' % (row['metric'], row['mean'], row['half_width'],
+                                                      ' (dropped)' if row['dropped'] else ''))
+    if args.output:
+        S.write_csv(args.output)
+
+def analyse(args):
+    """
+    Prints the closed-form KPIs of a product-form network, or why it
+    is not one; with --check, compares them with replications.
+    """
+    from params_to_network import create_network
+    from analytics import qualification, analyse as analyse_network, cross_check
+    params, horizon = load_params(args)
+    network = create_network(**params)
+    reasons = qualification(network)
+    if reasons:
+        raise SystemExit("Not an open product-form network:\n  " + "\n  ".join(reasons))
+    try:
+        analysis = analyse_network(network)
+    except ValueError as error:
+        raise SystemExit(str(error))
+    print('%-8s %10s %10s %10s %10s %10s %10s' % ('station', 'lambda', 'rho', 'Lq', 'L', 'Wq', 'W'))
+    for station, kpis in sorted(analysis['stations'].items()):
+        print('%-8d %10.6g %10s %10.6g %10.6g %10.6g %10.6g' % (
+            station, kpis['arrival_rate'],
+            '%.6g' % kpis['utilisation'] if kpis['utilisation'] is not None else '-',
+            kpis['mean_queue_length'], kpis['mean_patients'], kpis['mean_wait'], kpis['mean_time_in_station']))
+    print('network throughput=%.6g L=%.6g W=%.6g' % (analysis['network']['throughput'],
+                                                    analysis['network']['mean_patients'],
+                                                    analysis['network']['mean_sojourn_time']))
+    if args.check:
+        print('')
+        for row in cross_check(network, horizon, args.replications, warmup=args.warmup,
+                               seed=args.seed, processes=args.processes):
+            print('%-16s analytic=%.6g simulated=%.6g half_width=%.3g%s' % (
+                row['metric'], row['analytic'], row['simulated'], row['half_width'],
+                '' if row['within'] else '  OUTSIDE'))
+
+def export(args):
+    """
+    Converts records between the csv layout and the columnar one,
+    in the direction given by the source.
+    """
+    import os
+    from columnar import csv_to_columns, columns_to_csv
+    if os.path.isdir(args.source):
+        columns_to_csv(args.source, args.destination)
+    else:
+        csv_to_columns(args.source, args.destination)
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Queueing network simulation')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    network = network_parser()
+
+    run_parser = subparsers.add_parser('run', parents=[network],
+                                       help='run an example case or a network once')
+    run_parser.add_argument('--seed', type=int, default=1)
+    run_parser.add_argument('--path', type=str, default='./all_records.csv')
+    run_parser.add_argument('--no-csv', dest='write_csv', action='store_false',
+                            help='do not write the records')
+    run_parser.add_argument('--plot', action='store_true', help='plot waiting times (needs matplotlib)')
+    run_parser.add_argument('--progress', action='store_true', help='show a progress bar (needs tqdm)')
+    run_parser.set_defaults(function=run)
+
+    for name, function, description in (('replicate', replicate, 'replicate a network over processes'),
+                                         ('sweep', sweep, 'sweep network parameters')):
+        sub = subparsers.add_parser(name, parents=[network], help=description)
+        sub.add_argument('--replications', type=int, default=10)
+        sub.add_argument('--seed', type=int, default=0)
+        sub.add_argument('--processes', type=int, default=None)
+        sub.add_argument('--cache', type=str, default=None, help='result cache directory')
+        sub.add_argument('--output', type=str, default=None)
+        sub.set_defaults(function=function)
+        if name == 'sweep':
+            sub.add_argument('--grid', type=str, default=None, help='json {parameter: [values]}')
+            sub.add_argument('--overrides', type=str, default=None, help='json [{parameter: value}]')
+            sub.add_argument('--objective', type=str, default=None, help='metric to drop dominated configurations on')
+            sub.add_argument('--maximise', action='store_true')
+
+    analyse_parser = subparsers.add_parser('analyse', parents=[network],
+                                           help='closed-form KPIs of a product-form network')
+    analyse_parser.add_argument('--check', action='store_true', help='compare with replications')
+    analyse_parser.add_argument('--replications', type=int, default=10)
+    analyse_parser.add_argument('--warmup', type=float, default=0.0)
+    analyse_parser.add_argument('--seed', type=int, default=0)
+    analyse_parser.add_argument('--processes', type=int, default=None)
+    analyse_parser.set_defaults(function=analyse)
+
+    export_parser = subparsers.add_parser('export', help='convert records between csv and columnar layouts')
+    export_parser.add_argument('source', help='records csv file, or columnar directory')
+    export_parser.add_argument('destination')
+    export_parser.set_defaults(function=export)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.function(args)
+
+if __name__ == '__main__':
+    main()
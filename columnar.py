@@ -0,0 +1,160 @@
+from __future__ import division
+
+import os
+import sys
+import json
+import mmap
+from array import array
+from ast import literal_eval
+from csv import reader
+
+from records import RECORD_FIELDS, RECORD_HEADERS, CSVRecordSink
+
+NPY_MAGIC = b'\x93NUMPY\x01\x00'
+NPY_HEADER_SIZE = 128
+NPY_DESCR = {'q': '<i8', 'd': '<f8'}
+MANIFEST = 'records.json'
+
+def npy_header(typecode, length):
+    """
+    Returns a version 1.0 .npy header of fixed size NPY_HEADER_SIZE,
+    so it can be rewritten in place once the final length is known.
+    """
+    header = "{'descr': '%s', 'fortran_order': False, 'shape': (%d,), }" % (
+        NPY_DESCR[typecode], length)
+    header = header.ljust(NPY_HEADER_SIZE - len(NPY_MAGIC) - 2 - 1) + '\n'
+    return NPY_MAGIC + len(header).to_bytes(2, 'little') + header.encode('latin1')
+
+def read_npy_header(npy_file):
+    """
+    Returns (typecode, length, data offset) of a 1-d .npy file.
+    """
+    if npy_file.read(len(NPY_MAGIC)) != NPY_MAGIC:
+        raise ValueError("%s is not a version 1.0 .npy file." % npy_file.name)
+    header_len = int.from_bytes(npy_file.read(2), 'little')
+    header = literal_eval(npy_file.read(header_len).decode('latin1'))
+    typecodes = {descr: typecode for typecode, descr in NPY_DESCR.items()}
+    return typecodes[header['descr']], header['shape'][0], len(NPY_MAGIC) + 2 + header_len
+
+class NpyColumnWriter(object):
+    """
+    Appends one typed column to a .npy file in chunks.
+    """
+
+    def __init__(self, file_name, typecode):
+        self.typecode = typecode
+        self.length = 0
+        self.npy_file = open(file_name, 'wb')
+        self.npy_file.write(npy_header(typecode, 0))
+
+    def write(self, values):
+        if sys.byteorder == 'big':
+            values = array(self.typecode, values)
+            values.byteswap()
+        self.npy_file.write(values.tobytes())
+        self.length += len(values)
+
+    def close(self):
+        self.npy_file.seek(0)
+        self.npy_file.write(npy_header(self.typecode, self.length))
+        self.npy_file.close()
+
+class ColumnarRecordSink(object):
+    """
+    Streams records into a directory holding one .npy file per Record
+    field and a small json manifest with the field order and csv headers.
+    """
+
+    def __init__(self, directory, chunk_size=65536):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.number_of_records = 0
+        self.buffers = [array(typecode) for _, typecode in RECORD_FIELDS]
+        self.writers = [NpyColumnWriter(os.path.join(directory, field + '.npy'), typecode)
+                        for field, typecode in RECORD_FIELDS]
+        self.closed = False
+
+    def __len__(self):
+        return self.number_of_records
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def append(self, *values):
+        for column, value in zip(self.buffers, values):
+            column.append(value)
+        self.number_of_records += 1
+        if len(self.buffers[0]) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        for column, column_writer in zip(self.buffers, self.writers):
+            column_writer.write(column)
+            del column[:]
+
+    def close(self):
+        if self.closed:
+            return
+        self.flush()
+        for column_writer in self.writers:
+            column_writer.close()
+        with open(os.path.join(self.directory, MANIFEST), 'w') as manifest:
+            json.dump({'fields': [field for field, _ in RECORD_FIELDS],
+                       'headers': RECORD_HEADERS,
+                       'number_of_records': self.number_of_records}, manifest)
+        self.closed = True
+
+def load_columns(directory, mmap_mode='r'):
+    """
+    Returns {field: column} for a directory written by ColumnarRecordSink.
+    Columns are memory-mapped NumPy arrays; without NumPy they are
+    memoryviews over the mapped files. Neither copies the data.
+    """
+    with open(os.path.join(directory, MANIFEST)) as manifest:
+        fields = json.load(manifest)['fields']
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+
+    columns = {}
+    for field in fields:
+        file_name = os.path.join(directory, field + '.npy')
+        if numpy is not None:
+            columns[field] = numpy.load(file_name, mmap_mode=mmap_mode)
+            continue
+        with open(file_name, 'rb') as npy_file:
+            typecode, length, offset = read_npy_header(npy_file)
+            mapped = mmap.mmap(npy_file.fileno(), 0, access=mmap.ACCESS_READ)
+        columns[field] = memoryview(mapped)[offset:].cast(typecode)[:length]
+    return columns
+
+def csv_to_columns(csv_file, directory, chunk_size=65536):
+    """
+    Converts a csv written by write_records_to_file (with headers)
+    into the columnar layout.
+    """
+    casts = [int if typecode == 'q' else float for _, typecode in RECORD_FIELDS]
+    with open(csv_file, 'r', newline='') as data_file:
+        rdr = reader(data_file)
+        if next(rdr) != RECORD_HEADERS:
+            raise ValueError("%s does not have the record headers." % csv_file)
+        with ColumnarRecordSink(directory, chunk_size) as sink:
+            for row in rdr:
+                sink.append(*[cast(value) for cast, value in zip(casts, row)])
+
+def columns_to_csv(directory, csv_file, headers=True, chunk_size=65536):
+    """
+    Writes a columnar record directory back to the csv layout.
+    """
+    loaded = load_columns(directory)
+    columns = [loaded[field] for field, _ in RECORD_FIELDS]
+    with CSVRecordSink(csv_file, headers=headers, chunk_size=chunk_size) as sink:
+        for start in range(0, len(columns[0]), chunk_size):
+            for row in zip(*[column[start:start + chunk_size].tolist() for column in columns]):
+                sink.append(*row)
@@ -0,0 +1,177 @@
+from __future__ import division
+
+import os
+import mmap
+from array import array
+from csv import reader
+
+from utils import truncated_normal
+from alias import AliasTable
+
+class EmpiricalCache(object):
+    """
+    Shared, read-only store of Empirical samples, loaded once per file
+    (again if its size or modification time changes).
+
+    A csv file is parsed once (first row) into a typed array. A .npy
+    file (e.g. written by columnar.NpyColumnWriter) is memory-mapped
+    when use_mmap is set, so processes reading it share the pages.
+    Values are returned as read-only memoryviews.
+    """
+
+    def __init__(self, use_mmap=True):
+        self.use_mmap = use_mmap
+        self.values = {}
+
+    def load(self, file_name):
+        file_name = os.path.abspath(file_name)
+        status = os.stat(file_name)
+        stamp = (status.st_size, status.st_mtime_ns)
+        if self.values.get(file_name, (None,))[0] != stamp:
+            if file_name.endswith('.npy'):
+                self.values[file_name] = (stamp, self.load_npy(file_name))
+            else:
+                self.values[file_name] = (stamp, self.load_csv(file_name))
+        return self.values[file_name][1]
+
+    def load_csv(self, file_name):
+        with open(file_name, 'r') as empirical_file:
+            row = next(reader(empirical_file))
+        return memoryview(array('d', [float(x) for x in row])).toreadonly()
+
+    def load_npy(self, file_name):
+        from columnar import read_npy_header
+        with open(file_name, 'rb') as npy_file:
+            typecode, length, offset = read_npy_header(npy_file)
+            if self.use_mmap:
+                data = mmap.mmap(npy_file.fileno(), 0, access=mmap.ACCESS_READ)
+                return memoryview(data)[offset:].cast(typecode)[:length].toreadonly()
+            npy_file.seek(offset)
+            values = array(typecode)
+            values.frombytes(npy_file.read())
+        return memoryview(values).toreadonly()
+
+empirical_cache = EmpiricalCache()
+
+class NoArrivals(object):
+    __slots__ = ()
+
+    def __call__(self, current_time=None):
+        return float('Inf')
+
+class Uniform(object):
+    __slots__ = ('lower', 'upper', 'uniform')
+
+    def __init__(self, lower, upper, rng):
+        self.lower = lower
+        self.upper = upper
+        self.uniform = rng.uniform
+
+    def __call__(self, current_time=None):
+        return self.uniform(self.lower, self.upper)
+
+class Deterministic(object):
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __call__(self, current_time=None):
+        return self.value
+
+class Exponential(object):
+    __slots__ = ('rate', 'expovariate')
+
+    def __init__(self, rate, rng):
+        self.rate = rate
+        self.expovariate = rng.expovariate
+
+    def __call__(self, current_time=None):
+        return self.expovariate(self.rate)
+
+class Normal(object):
+    """
+    Normal distribution truncated at 0.
+    """
+    __slots__ = ('mean', 'sd', 'rng')
+
+    def __init__(self, mean, sd, rng):
+        self.mean = mean
+        self.sd = sd
+        self.rng = rng
+
+    def __call__(self, current_time=None):
+        return truncated_normal(self.mean, self.sd, rng=self.rng)
+
+class Custom(object):
+    __slots__ = ('table', 'rng')
+
+    def __init__(self, values, probs, rng):
+        self.table = AliasTable(values, probs)
+        self.rng = rng
+
+    def __call__(self, current_time=None):
+        return self.table.draw(self.rng)
+
+class Empirical(object):
+    __slots__ = ('values', 'size', 'random')
+
+    def __init__(self, values, rng):
+        self.values = values
+        self.size = len(values)
+        self.random = rng.random
+
+    def __call__(self, current_time=None):
+        return self.values[int(self.random() * self.size)]
+
+class UserDefined(object):
+    __slots__ = ('func',)
+
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, current_time=None):
+        sample = self.func()
+        if not isinstance(sample, float) or sample < 0:
+            raise ValueError("UserDefined func must return positive float.")
+        return sample
+
+class TimeDependent(object):
+    __slots__ = ('func',)
+
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, current_time):
+        sample = self.func(current_time)
+        if not isinstance(sample, float) or sample < 0:
+            raise ValueError("TimeDependent func must return positive float.")
+        return sample
+
+def compile_distribution(dist, rng, cache=empirical_cache):
+    """
+    Turns a create_network distribution spec into a sampler with its
+    parameters bound. Every sampler is called as sampler(current_time);
+    only TimeDependent ones use the date.
+    """
+    if dist == 'NoArrivals':
+        return NoArrivals()
+    if dist[0] == 'Uniform':
+        return Uniform(dist[1], dist[2], rng)
+    if dist[0] == 'Deterministic':
+        return Deterministic(dist[1])
+    if dist[0] == 'Exponential':
+        return Exponential(dist[1], rng)
+    if dist[0] == 'Normal':
+        return Normal(dist[1], dist[2], rng)
+    if dist[0] == 'Custom':
+        return Custom(dist[1], dist[2], rng)
+    if dist[0] == 'UserDefined':
+        return UserDefined(dist[1])
+    if dist[0] == 'TimeDependent':
+        return TimeDependent(dist[1])
+    if dist[0] == 'Empirical':
+        if isinstance(dist[1], str):
+            return Empirical(cache.load(dist[1]), rng)
+        return Empirical(dist[1], rng)
+    raise ValueError("Unknown distribution %r." % (dist,))
@@ -0,0 +1,71 @@
+from __future__ import division
+
+from heapq import heappush, heappop
+
+from utils import random_choice
+
+class EventCalendar(object):
+    """
+    Future event list of the simulation.
+
+    Holds one entry (date, position, version) per scheduled station in a
+    binary heap. Rescheduling a station bumps its version, so superseded
+    entries stay in the heap and are discarded lazily when they surface.
+    """
+
+    def __init__(self, stations, rng):
+        self.stations = stations
+        self.rng = rng
+        self.positions = {station: i for i, station in enumerate(stations)}
+        self.dates = [float('Inf') for _ in stations]
+        self.versions = [0 for _ in stations]
+        self.heap = []
+
+        for station in stations:
+            self.schedule(station)
+
+    def schedule(self, station):
+        """
+        (Re)schedules station at its current next_event_date.
+        """
+        position = self.positions[station]
+        date = station.next_event_date
+        if date == self.dates[position]:
+            return
+        self.dates[position] = date
+        self.versions[position] += 1
+        if date != float('Inf'):
+            heappush(self.heap, (date, position, self.versions[position]))
+
+    def is_current(self, entry):
+        date, position, version = entry
+        return self.versions[position] == version
+
+    def discard_stale(self):
+        while self.heap and not self.is_current(self.heap[0]):
+            heappop(self.heap)
+
+    def next_active_station(self):
+        """
+        Returns the station with the earliest next_event_date.
+        Simultaneous events are resolved uniformly at random
+        among the tied stations, taken in station order.
+        """
+        self.discard_stale()
+        if not self.heap:
+            return self.stations[-1]
+
+        next_event_date = self.heap[0][0]
+        tied = []
+        while self.heap and self.heap[0][0] == next_event_date:
+            entry = heappop(self.heap)
+            if self.is_current(entry):
+                tied.append(entry)
+
+        # entries stay in the calendar, only the choice is made here
+        for entry in tied:
+            heappush(self.heap, entry)
+
+        if len(tied) > 1:
+            return self.stations[random_choice(tied, rng=self.rng)[1]]
+        return self.stations[tied[0][1]]
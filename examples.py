@@ -0,0 +1,175 @@
+from __future__ import division
+
+import random
+from collections import Counter
+
+from params_to_network import create_network
+from simulation import Simulation
+
+# create_network parameters and horizon of the example cases
+CASES = {
+    'basic_3': (dict(
+        Arrival_distributions=[['Exponential', 0.2]],
+        Service_distributions=[['Exponential', 0.1]],
+        Number_of_servers=[3]), 1440),
+
+    'basic_4': (dict(
+        Arrival_distributions=[['Exponential', 0.2]],
+        Service_distributions=[['Exponential', 0.1]],
+        Number_of_servers=[4]), 1640),
+
+    'homo_class_with_transition': (dict(
+        Arrival_distributions=[['Exponential', 0.3],
+                               ['Exponential', 0.2],
+                               'NoArrivals'],
+        Service_distributions=[['Exponential', 1.0],
+                               ['Exponential', 0.4],
+                               ['Exponential', 0.5]],
+        Transition_matrices=[[0.0, 0.3, 0.7],
+                             [0.0, 0.0, 1.0],
+                             [0.0, 0.0, 0.0]],
+        Number_of_servers=[1, 2, 2]), 200),
+
+    'hetero_class_with_transition': (dict(
+        Arrival_distributions={'Class 0': [['Exponential', 1.0],
+                                           'NoArrivals',
+                                           'NoArrivals'],
+                               'Class 1': [['Exponential', 2.0],
+                                           'NoArrivals',
+                                           'NoArrivals']},
+        Service_distributions={'Class 0': [['Exponential', 4.0],
+                                           ['Exponential', 1.0],
+                                           ['Deterministic', 0.0]],
+                               'Class 1': [['Exponential', 6.0],
+                                           ['Deterministic', 0.0],
+                                           ['Exponential', 1.0]]},
+        Transition_matrices={'Class 0': [[0.0, 1.0, 0.0],
+                                         [0.0, 0.0, 0.0],
+                                         [0.0, 0.0, 0.0]],
+                             'Class 1': [[0.0, 0.0, 1.0],
+                                         [0.0, 0.0, 0.0],
+                                         [0.0, 0.0, 0.0]]},
+        Number_of_servers=[1, 2, 3]), 30),
+
+    'priority': (dict(
+        Arrival_distributions={'Class 0': [['Exponential', 5]],
+                               'Class 1': [['Exponential', 5]]},
+        Service_distributions={'Class 0': [['Exponential', 10]],
+                               'Class 1': [['Exponential', 10]]},
+        Priority_classes={'Class 0': 0, 'Class 1': 1},
+        Number_of_servers=[1]), 100.0),
+
+    'class_change': (dict(
+        Arrival_distributions={'Class 0': [['Exponential', 5]],
+                               'Class 1': ['NoArrivals'],
+                               'Class 2': ['NoArrivals']},
+        Service_distributions={'Class 0': [['Exponential', 10]],
+                               'Class 1': [['Exponential', 10]],
+                               'Class 2': [['Exponential', 10]]},
+        Transition_matrices={'Class 0': [[1.0]],
+                             'Class 1': [[1.0]],
+                             'Class 2': [[1.0]]},
+        Class_change_matrices={'Station 1': [[0.0, 0.5, 0.5],
+                                             [0.5, 0.0, 0.5],
+                                             [0.5, 0.5, 0.0]]},
+        Number_of_servers=[1]), 50.0),
+}
+
+def case_network(case):
+    if case not in CASES:
+        raise ValueError("Unknown case %r, choose from %s." % (case, ', '.join(sorted(CASES))))
+    return create_network(**CASES[case][0])
+
+def mean(values):
+    return sum(values) / len(values)
+
+def basic_3(plot=False, progress_bar=False):
+    N = case_network('basic_3')
+    random.seed(1)
+    Q = Simulation(N)
+    Q.simulate_until_max_time(1440, progress_bar=progress_bar)
+    recs = Q.get_all_records()
+    waits = [r.waiting_time for r in recs]
+    print(mean(waits))
+
+    if plot:
+        import matplotlib.pyplot as plt
+        plt.hist(waits)
+        plt.show()
+    return Q
+
+def basic_4(plot=False, progress_bar=False):
+    N = case_network('basic_4')
+    average_waits = []
+    for trial in range(10):
+        random.seed(trial)
+        Q = Simulation(N)
+        Q.simulate_until_max_time(1640, progress_bar=progress_bar)
+        recs = Q.get_all_records()
+        waits = [r.waiting_time for r in recs if r.arrival_date > 100 and r.arrival_date < 1540]
+        average_waits.append(mean(waits))
+
+    print(mean(average_waits))
+    return Q
+
+def homo_class_with_transition(plot=False, progress_bar=False):
+    N = case_network('homo_class_with_transition')
+    completed_pats = []
+    for trial in range(10):
+        random.seed(trial)
+        Q = Simulation(N)
+        Q.simulate_until_max_time(200, progress_bar=progress_bar)
+        recs = Q.get_all_records()
+        completed_pats.append(len([r for r in recs if r.station == 3 and r.arrival_date < 180]))
+
+    print(mean(completed_pats))
+    return Q
+
+def hetero_class_with_transition(plot=False, progress_bar=False):
+    N = case_network('hetero_class_with_transition')
+    Q = Simulation(N)
+    Q.simulate_until_max_time(9, progress_bar=progress_bar)
+    recs = Q.get_all_records()
+    visited_by_babies = {1, 2}
+    print(set([r.station for r in recs if r.patient_class == 0]) == visited_by_babies)
+
+    average_waits = {1: [], 2: [], 3: []}
+    for trial in range(16):
+        random.seed(trial)
+        Q = Simulation(N)
+        Q.simulate_until_max_time(30, progress_bar=progress_bar)
+        recs = Q.get_all_records()
+        for station in average_waits:
+            waits = [r.waiting_time for r in recs
+                     if r.station == station and r.arrival_date > 3 and r.arrival_date < 27]
+            average_waits[station].append(mean(waits))
+
+    for station in average_waits:
+        print(mean(average_waits[station]))
+    return Q
+
+def priority(plot=False, progress_bar=False):
+    N = case_network('priority')
+    random.seed(1)
+    Q = Simulation(N)
+    Q.simulate_until_max_time(100.0, progress_bar=progress_bar)
+    recs = Q.get_all_records()
+    print(mean([r.waiting_time for r in recs if r.patient_class == 0]))
+    print(mean([r.waiting_time for r in recs if r.patient_class == 1]))
+    return Q
+
+def class_change(plot=False, progress_bar=False):
+    N = case_network('class_change')
+    random.seed(1)
+    Q = Simulation(N)
+    Q.simulate_until_max_time(50.0, progress_bar=progress_bar)
+    recs = Q.get_all_records()
+    print(Counter([r.patient_class for r in recs]))
+    return Q
+
+RUNS = {'basic_3': basic_3,
+        'basic_4': basic_4,
+        'homo_class_with_transition': homo_class_with_transition,
+        'hetero_class_with_transition': hetero_class_with_transition,
+        'priority': priority,
+        'class_change': class_change}
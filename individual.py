@@ -1,19 +1,28 @@
 from __future__ import division
 
+NaN = float('nan')
+
 class Server(object):
 
+    __slots__ = ('station', 'id_number', 'patient', 'busy',
+                 'start_date', 'busy_time', 'total_time', 'next_end_service_date',
+                 'partial_busy_time', 'busy_profile')
+
     def __init__(self, station, id_number, start_date=0.0):
 
         self.station = station
         self.id_number = id_number
 
-        self.patient = False
+        self.patient = None
         self.busy = False
 
         self.start_date = start_date
-        self.busy_time = False
-        self.total_time = False
+        self.busy_time = 0.0
+        self.total_time = 0.0
         self.next_end_service_date = float('Inf')
+        # busy time of the ongoing service counted at the last wrap up
+        self.partial_busy_time = 0.0
+        self.busy_profile = None
 
     @property
     def utilisation(self):
@@ -21,26 +30,57 @@ class Server(object):
 
 class Patient(object):
 
+    __slots__ = ('id_number', 'number_of_records', 'server', 'destination',
+                 'patient_class', 'prev_class', 'priority_class', 'prev_priority_class',
+                 'arrival_date', 'service_start_date', 'service_time',
+                 'service_end_date', 'exit_date',
+                 'queue_size_at_arrival', 'queue_size_at_departure')
+
     def __init__(self, id_number, patient_class=0, priority_class=0):
+        self.reset(id_number, patient_class, priority_class)
+
+    def reset(self, id_number, patient_class=0, priority_class=0):
 
         # static
         self.id_number = id_number
-        self.data_records = []
+        self.number_of_records = 0
 
         # dynamic
-        self.server = False
-        self.destination = False
+        self.server = None
+        self.destination = None
 
         self.patient_class = patient_class
         self.prev_class = patient_class
         self.priority_class = priority_class
         self.prev_priority_class = priority_class
 
-        self.arrival_date = False
-        self.service_start_date = False
-        self.service_time = False
-        self.service_end_date = False
-        self.exit_date = False
+        self.arrival_date = NaN
+        self.service_start_date = NaN
+        self.service_time = NaN
+        self.service_end_date = NaN
+        self.exit_date = NaN
+
+        self.queue_size_at_arrival = None
+        self.queue_size_at_departure = None
+
+class PatientPool(object):
+    """
+    Free list of Patient objects that have left the system
+    (exited or were rejected), reused for new arrivals.
+    """
+
+    def __init__(self):
+        self.free = []
+
+    def __len__(self):
+        return len(self.free)
+
+    def acquire(self, id_number, patient_class=0, priority_class=0):
+        if self.free:
+            patient = self.free.pop()
+            patient.reset(id_number, patient_class, priority_class)
+            return patient
+        return Patient(id_number, patient_class, priority_class)
 
-        self.queue_size_at_arrival = False
-        self.queue_size_at_departure = False
+    def recycle(self, patient):
+        self.free.append(patient)
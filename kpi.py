@@ -0,0 +1,312 @@
+from __future__ import division
+
+from math import sqrt, asin, sin, pi
+
+class Welford(object):
+    """
+    Streaming count, mean, variance, min and max (Welford's algorithm).
+    Two accumulators merge exactly (Chan et al.).
+    """
+
+    __slots__ = ('count', 'mean', 'm2', 'min', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = float('Inf')
+        self.max = -float('Inf')
+
+    def add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+
+    def merge(self, other):
+        if other.count == 0:
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    @property
+    def variance(self):
+        if self.count < 2:
+            return float('nan')
+        return self.m2 / (self.count - 1)
+
+    @property
+    def sd(self):
+        return sqrt(self.variance)
+
+class TDigest(object):
+    """
+    Merging t-digest (Dunning) with the k1 scale function: a mergeable
+    quantile sketch of at most about compression centroids, most
+    accurate in the tails.
+    """
+
+    def __init__(self, compression=100):
+        self.compression = compression
+        self.centroids = []
+        self.buffer = []
+        self.count = 0
+        self.min = float('Inf')
+        self.max = -float('Inf')
+
+    def add(self, x, weight=1):
+        self.buffer.append((x, weight))
+        self.count += weight
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+        if len(self.buffer) >= 5 * self.compression:
+            self.compress()
+
+    def q_limit(self, q):
+        """
+        Largest quantile a centroid starting at q may reach.
+        """
+        k = self.compression / (2 * pi) * asin(2 * q - 1) + 1
+        k = min(k, self.compression / 4)
+        return (sin(k * 2 * pi / self.compression) + 1) / 2
+
+    def compress(self):
+        if not self.buffer:
+            return
+        items = sorted(self.centroids + self.buffer)
+        self.buffer = []
+        centroids = []
+        q0 = 0.0
+        limit = self.q_limit(q0)
+        mean, weight = items[0]
+        for x, w in items[1:]:
+            if q0 + (weight + w) / self.count <= limit:
+                weight += w
+                mean += (x - mean) * w / weight
+            else:
+                centroids.append((mean, weight))
+                q0 += weight / self.count
+                limit = self.q_limit(q0)
+                mean, weight = x, w
+        centroids.append((mean, weight))
+        self.centroids = centroids
+
+    def merge(self, other):
+        if other.count == 0:
+            return self
+        self.buffer.extend(other.centroids)
+        self.buffer.extend(other.buffer)
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.compress()
+        return self
+
+    def quantile(self, p):
+        self.compress()
+        if not self.centroids:
+            return float('nan')
+        if len(self.centroids) == 1:
+            return self.centroids[0][0]
+        target = p * self.count
+        # centroid i is taken to sit at its cumulative mid-weight
+        cumulative = 0.0
+        prev_mean, prev_position = self.min, 0.0
+        for mean, weight in self.centroids:
+            position = cumulative + weight / 2
+            if target < position:
+                if position == prev_position:
+                    return mean
+                return prev_mean + (mean - prev_mean) * (target - prev_position) / (position - prev_position)
+            prev_mean, prev_position = mean, position
+            cumulative += weight
+        if self.count == prev_position:
+            return self.max
+        return prev_mean + (self.max - prev_mean) * (target - prev_position) / (self.count - prev_position)
+
+class KPIAccumulator(object):
+    """
+    Online statistics of the records of one (station, class, window):
+    waiting, service and sojourn (arrival to exit) times, with quantile
+    sketches of waiting and sojourn times when quantiles is set.
+    """
+
+    def __init__(self, quantiles=True):
+        self.waiting_time = Welford()
+        self.service_time = Welford()
+        self.sojourn_time = Welford()
+        self.waiting_digest = TDigest() if quantiles else None
+        self.sojourn_digest = TDigest() if quantiles else None
+
+    @property
+    def completions(self):
+        return self.waiting_time.count
+
+    def add(self, waiting_time, service_time, sojourn_time):
+        self.waiting_time.add(waiting_time)
+        self.service_time.add(service_time)
+        self.sojourn_time.add(sojourn_time)
+        if self.waiting_digest is not None:
+            self.waiting_digest.add(waiting_time)
+            self.sojourn_digest.add(sojourn_time)
+
+    def merge(self, other):
+        self.waiting_time.merge(other.waiting_time)
+        self.service_time.merge(other.service_time)
+        self.sojourn_time.merge(other.sojourn_time)
+        if self.waiting_digest is not None and other.waiting_digest is not None:
+            self.waiting_digest.merge(other.waiting_digest)
+            self.sojourn_digest.merge(other.sojourn_digest)
+        return self
+
+    def summary(self, percentiles=(0.5, 0.9, 0.95)):
+        summary = {'completions': self.completions}
+        for name in ('waiting_time', 'service_time', 'sojourn_time'):
+            welford = getattr(self, name)
+            summary['mean_' + name] = welford.mean if welford.count else float('nan')
+            summary['sd_' + name] = welford.sd
+        if self.waiting_digest is not None:
+            for p in percentiles:
+                summary['p%g_waiting_time' % (100 * p)] = self.waiting_digest.quantile(p)
+                summary['p%g_sojourn_time' % (100 * p)] = self.sojourn_digest.quantile(p)
+        return summary
+
+class KPICollector(object):
+    """
+    Record sink keeping KPIAccumulators keyed by (station, clss, window),
+    updated as records are written.
+
+    Every record counts in window 'all'; windows maps further window
+    names to (start, end) and a record counts in a window when its
+    arrival date lies in [start, end).
+    """
+
+    def __init__(self, windows=None, quantiles=True):
+        self.windows = windows if windows is not None else {}
+        self.quantiles = quantiles
+        self.accumulators = {}
+
+    def accumulator(self, station, clss, window):
+        key = (station, clss, window)
+        if key not in self.accumulators:
+            self.accumulators[key] = KPIAccumulator(self.quantiles)
+        return self.accumulators[key]
+
+    def append(self, id_number, patient_class, station, arrival_date, waiting_time,
+               service_start_date, service_time, service_end_date, exit_date, *rest):
+        sojourn_time = exit_date - arrival_date
+        self.accumulator(station, patient_class, 'all').add(waiting_time, service_time, sojourn_time)
+        for window, (start, end) in self.windows.items():
+            if start <= arrival_date < end:
+                self.accumulator(station, patient_class, window).add(
+                    waiting_time, service_time, sojourn_time)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def merge(self, other):
+        for key, accumulator in other.accumulators.items():
+            self.accumulator(*key).merge(accumulator)
+        return self
+
+    def get(self, station=None, clss=None, window='all'):
+        """
+        Returns the KPIAccumulator of station and clss in window, pooled
+        over all stations and/or classes where those are None.
+        """
+        pooled = KPIAccumulator(self.quantiles)
+        for (s, c, w), accumulator in self.accumulators.items():
+            if w == window and station in (None, s) and clss in (None, c):
+                pooled.merge(accumulator)
+        return pooled
+
+    def summary(self):
+        return {key: accumulator.summary() for key, accumulator in self.accumulators.items()}
+
+class TimeWeighted(object):
+    """
+    Time integral of a piecewise-constant quantity (patients present,
+    busy servers, ...), updated in O(1) whenever the quantity changes.
+
+    With bucket_width, the integral is also split into consecutive
+    buckets of that width (e.g. 60 for hourly profiles with minutes).
+    The buckets always add up to the whole integral, whatever the width:
+
+    >>> t = TimeWeighted(value=1, bucket_width=7.77)
+    >>> t.update(5 * 7.77, 3); t.update(100.0, 0)
+    >>> abs(sum(t.buckets) - t.area) < 1e-9
+    True
+    """
+
+    __slots__ = ('value', 'start_date', 'last_date', 'area', 'bucket_width', 'buckets')
+
+    def __init__(self, value=0, start_date=0.0, bucket_width=None):
+        self.value = value
+        self.start_date = start_date
+        self.last_date = start_date
+        self.area = 0.0
+        self.bucket_width = bucket_width
+        self.buckets = []
+
+    def advance(self, date):
+        """
+        Accumulates the current value up to date.
+        """
+        if date <= self.last_date:
+            return
+        self.area += self.value * (date - self.last_date)
+        if self.bucket_width is not None and self.value:
+            width = self.bucket_width
+            start = self.last_date
+            # step the index rather than recompute it: start // width
+            # can give back the previous bucket at a float boundary
+            bucket = int(start // width)
+            while start < date:
+                end = min((bucket + 1) * width, date)
+                if bucket >= len(self.buckets):
+                    self.buckets.extend([0.0] * (bucket + 1 - len(self.buckets)))
+                if end > start:
+                    self.buckets[bucket] += self.value * (end - start)
+                bucket += 1
+                start = end
+        self.last_date = date
+
+    def update(self, date, value):
+        self.advance(date)
+        self.value = value
+
+    def mean(self):
+        if self.last_date == self.start_date:
+            return float('nan')
+        return self.area / (self.last_date - self.start_date)
+
+    def bucket_means(self):
+        """
+        Time average of each bucket up to the last update.
+        """
+        if self.bucket_width is None:
+            return []
+        width = self.bucket_width
+        number_of_buckets = int(-(-self.last_date // width))
+        areas = self.buckets + [0.0] * (number_of_buckets - len(self.buckets))
+        means = []
+        for bucket, area in enumerate(areas):
+            start = max(bucket * width, self.start_date)
+            end = min((bucket + 1) * width, self.last_date)
+            means.append(area / (end - start) if end > start else float('nan'))
+        return means
@@ -1,7 +1,5 @@
 import os
-import yaml
 import copy
-import pdb
 
 from network import StationClass, PatientClass, Network
 
@@ -97,6 +95,7 @@ def create_network(Arrival_distributions=None,  # required
     return Net
 
 if __name__ == "__main__":
+    import pdb
 
     check_mode = 'priority'
 
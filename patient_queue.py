@@ -0,0 +1,99 @@
+from __future__ import division
+
+from collections import deque
+from heapq import heappush, heappop
+from itertools import count
+
+class PatientQueue(object):
+    """
+    Patients present at one station.
+
+    Waiting patients are held in one FIFO deque per priority level,
+    patients in service are grouped by service_end_date. Every patient
+    keeps the (priority, arrival sequence) key it was accepted with,
+    which reproduces the order of the former flattened patient list.
+
+    With track_completions, the distinct service end dates are also kept
+    in a min-heap, for stations (infinite-server ones) that have no
+    Server objects to find their next completion; dates no longer in
+    service are discarded lazily.
+    """
+
+    def __init__(self, priority_lev, track_completions=False):
+        self.waiting = [deque() for _ in range(priority_lev)]
+        self.in_service = {}
+        self.keys = {}
+        self.sequence = count()
+        self.track_completions = track_completions
+        self.completion_dates = []
+
+    def __len__(self):
+        return len(self.keys)
+
+    def join(self, patient, priority_class):
+        self.keys[patient] = (priority_class, next(self.sequence))
+
+    def wait(self, patient, priority_class):
+        """
+        Adds patient to the back of its priority queue.
+        """
+        self.join(patient, priority_class)
+        self.waiting[priority_class].append(patient)
+
+    def serve(self, patient, priority_class=None):
+        """
+        Files patient under its service_end_date.
+        """
+        if patient not in self.keys:
+            self.join(patient, priority_class)
+        date = patient.service_end_date
+        if date in self.in_service:
+            self.in_service[date].append(patient)
+        else:
+            self.in_service[date] = [patient]
+            if self.track_completions:
+                heappush(self.completion_dates, date)
+
+    def next_waiting(self):
+        """
+        Removes and returns the first waiting patient of the
+        highest priority, or None if nobody is waiting.
+        """
+        for queue in self.waiting:
+            if queue:
+                return queue.popleft()
+        return None
+
+    def completing(self, date):
+        """
+        Returns the patients whose service ends at date,
+        in acceptance order.
+        """
+        patients = self.in_service.get(date, [])
+        if len(patients) > 1:
+            return sorted(patients, key=self.keys.get)
+        return patients
+
+    def remove(self, patient):
+        """
+        Removes a patient in service from the station.
+        """
+        date = patient.service_end_date
+        self.in_service[date].remove(patient)
+        if not self.in_service[date]:
+            del self.in_service[date]
+        del self.keys[patient]
+
+    def next_completion_date(self):
+        """
+        Returns the earliest service_end_date in service (needs
+        track_completions).
+        """
+        while self.completion_dates:
+            if self.completion_dates[0] in self.in_service:
+                return self.completion_dates[0]
+            heappop(self.completion_dates)
+        return float('Inf')
+
+    def all_patients(self):
+        return sorted(self.keys, key=self.keys.get)
@@ -0,0 +1,143 @@
+from __future__ import division
+
+from time import perf_counter
+from collections import defaultdict
+
+class Profiler(object):
+    """
+    Opt-in instrumentation of the event loop.
+
+    attach wraps, on the instances of one Simulation only, the methods
+    making up an event: arrivals (ArrivalStation.have_event), service
+    completions (Station.have_event), class changes, routing, sampling
+    of inter-arrival and service times, record writing and the event
+    calendar. Unprofiled simulations run the plain methods.
+
+    It counts arrivals and completions by station and class, times every
+    phase inclusively and exclusively of the phases it calls, keeping
+    the exclusive times per call stack for flame graphs, and tracks the
+    high-water marks of patients present and waiting at every station.
+    """
+
+    def __init__(self):
+        self.arrivals = defaultdict(int)
+        self.completions = defaultdict(int)
+        self.total_time = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.stack_time = defaultdict(float)
+        self.max_patients = defaultdict(int)
+        self.max_waiting = defaultdict(int)
+        self.stack = []
+        self.child_time = []
+        self.start_wall = None
+
+    def timed(self, phase, function):
+        """
+        Returns function timed as phase.
+        """
+        stack, child_time = self.stack, self.child_time
+
+        def wrapped(*args, **kwargs):
+            stack.append(phase)
+            child_time.append(0.0)
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = perf_counter() - start
+                self.stack_time[tuple(stack)] += elapsed - child_time.pop()
+                stack.pop()
+                self.total_time[phase] += elapsed
+                self.calls[phase] += 1
+                if child_time:
+                    child_time[-1] += elapsed
+        return wrapped
+
+    def attach(self, simulation):
+        self.simulation = simulation
+        self.start_wall = perf_counter()
+        arrival_station = simulation.all_stations[0]
+
+        arrival = self.timed('arrivals', arrival_station.have_event)
+
+        def have_arrival():
+            self.arrivals[arrival_station.next_station, arrival_station.next_class] += 1
+            arrival()
+        arrival_station.have_event = have_arrival
+        arrival_station.inter_arrival = self.timed('arrivals: sampling', arrival_station.inter_arrival)
+
+        for station in simulation.transitive_stations:
+            label = 'station %d' % station.station_id
+            station.have_event = self.timed(label + ': completions', station.have_event)
+            station.change_patient_class = self.timed(label + ': class change', station.change_patient_class)
+            station.next_station = self.timed(label + ': routing', station.next_station)
+            station.get_service_time = self.timed(label + ': sampling', station.get_service_time)
+            station.write_patient_record = self.recording(station, self.timed(label + ': records',
+                                                                              station.write_patient_record))
+            station.accept = self.watching(station, station.accept)
+
+        calendar = simulation.event_calendar
+        calendar.schedule = self.timed('calendar', calendar.schedule)
+        calendar.next_active_station = self.timed('calendar', calendar.next_active_station)
+        return self
+
+    def recording(self, station, write_patient_record):
+        def wrapped(patient):
+            self.completions[station.station_id, patient.prev_class] += 1
+            write_patient_record(patient)
+        return wrapped
+
+    def watching(self, station, accept):
+        def wrapped(next_patient, current_time):
+            accept(next_patient, current_time)
+            if station.number_of_patients > self.max_patients[station.station_id]:
+                self.max_patients[station.station_id] = station.number_of_patients
+            waiting = sum(len(queue) for queue in station.patients.waiting)
+            if waiting > self.max_waiting[station.station_id]:
+                self.max_waiting[station.station_id] = waiting
+        return wrapped
+
+    def self_time(self):
+        """
+        Exclusive time of every phase, summed over its call stacks.
+        """
+        times = defaultdict(float)
+        for stack, seconds in self.stack_time.items():
+            times[stack[-1]] += seconds
+        return times
+
+    def report(self):
+        """
+        Returns a compact text report.
+        """
+        wall = perf_counter() - self.start_wall if self.start_wall is not None else float('nan')
+        profiled = sum(self.stack_time.values())
+        self_time = self.self_time()
+        lines = ['%d arrivals, %d completions, %.3f s profiled of %.3f s since attach'
+                 % (sum(self.arrivals.values()), sum(self.completions.values()), profiled, wall),
+                 '',
+                 '%-28s %10s %10s %10s %7s' % ('phase', 'calls', 'total s', 'self s', 'self %')]
+        for phase in sorted(self_time, key=self_time.get, reverse=True):
+            lines.append('%-28s %10d %10.4f %10.4f %6.1f%%' % (
+                phase, self.calls[phase], self.total_time[phase], self_time[phase],
+                100 * self_time[phase] / profiled if profiled else 0.0))
+        lines += ['', '%-10s %-6s %10s %12s' % ('station', 'class', 'arrivals', 'completions')]
+        for key in sorted(set(self.arrivals) | set(self.completions)):
+            lines.append('%-10d %-6d %10d %12d' % (key[0], key[1], self.arrivals.get(key, 0),
+                                                   self.completions.get(key, 0)))
+        lines += ['', '%-10s %14s %14s' % ('station', 'max patients', 'max waiting')]
+        for station in sorted(self.max_patients):
+            lines.append('%-10d %14d %14d' % (station, self.max_patients[station], self.max_waiting[station]))
+        return '\n'.join(lines)
+
+    def folded(self):
+        """
+        Returns the exclusive times as folded stacks ("frame;frame
+        microseconds" lines), the input of flamegraph.pl and speedscope.
+        """
+        return '\n'.join('%s %d' % (';'.join(('event loop',) + stack), round(1e6 * seconds))
+                         for stack, seconds in sorted(self.stack_time.items()))
+
+    def write_trace(self, file_name):
+        with open(file_name, 'w') as trace_file:
+            trace_file.write(self.folded() + '\n')
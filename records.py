@@ -0,0 +1,143 @@
+from __future__ import division
+
+from array import array
+from collections import namedtuple
+from csv import writer
+
+# (field, array typecode)
+RECORD_FIELDS = [('id_number', 'q'),
+                 ('patient_class', 'q'),
+                 ('station', 'q'),
+                 ('arrival_date', 'd'),
+                 ('waiting_time', 'd'),
+                 ('service_start_date', 'd'),
+                 ('service_time', 'd'),
+                 ('service_end_date', 'd'),
+                 ('exit_date', 'd'),
+                 ('destination', 'q'),
+                 ('queue_size_at_arrival', 'q'),
+                 ('queue_size_at_departure', 'q')]
+
+RECORD_HEADERS = ['I.D. Number',
+                  'Customer Class',
+                  'Node',
+                  'Arrival Date',
+                  'Waiting Time',
+                  'Service Start Date',
+                  'Service Time',
+                  'Service End Date',
+                  'Exit Date',
+                  'Destination',
+                  'Queue Size at Arrival',
+                  'Queue Size at Departure']
+
+Record = namedtuple('Record', [field for field, _ in RECORD_FIELDS])
+
+class RecordStore(object):
+    """
+    Append-only columnar store of the simulation records.
+
+    Each field of Record is kept in its own typed array, so a record
+    costs a few machine words instead of a tuple object. Rows are only
+    materialised as Record tuples when they are read back.
+    """
+
+    def __init__(self):
+        self.fields = [field for field, _ in RECORD_FIELDS]
+        self.columns = [array(typecode) for _, typecode in RECORD_FIELDS]
+        self.index = {field: i for i, field in enumerate(self.fields)}
+
+    def __len__(self):
+        return len(self.columns[0])
+
+    def append(self, *values):
+        for column, value in zip(self.columns, values):
+            column.append(value)
+
+    def row(self, i):
+        return Record(*[column[i] for column in self.columns])
+
+    def rows(self):
+        return [Record(*values) for values in zip(*self.columns)]
+
+    def column(self, field):
+        """
+        Returns a zero-copy memoryview over one column.
+        """
+        return memoryview(self.columns[self.index[field]])
+
+    def as_numpy(self, field):
+        """
+        Returns one column as a NumPy array sharing the store's memory.
+        The array is invalidated by further appends.
+        """
+        import numpy
+        return numpy.frombuffer(self.columns[self.index[field]],
+                                dtype=self.columns[self.index[field]].typecode)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+class NullRecordSink(object):
+    """
+    Discards records, e.g. when only online statistics are wanted.
+    """
+
+    def __len__(self):
+        return 0
+
+    def append(self, *values):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+class CSVRecordSink(object):
+    """
+    Streams records to a csv file while the simulation runs.
+
+    Rows are buffered and written chunk_size at a time, so memory held
+    by the records stays bounded however long the run is.
+    """
+
+    def __init__(self, file_name, headers=True, chunk_size=10000):
+        self.file_name = file_name
+        self.chunk_size = chunk_size
+        self.buffer = []
+        self.number_of_records = 0
+        self.data_file = open(file_name, 'w', newline='')
+        self.csv_wrtr = writer(self.data_file)
+        if headers:
+            self.csv_wrtr.writerow(RECORD_HEADERS)
+
+    def __len__(self):
+        return self.number_of_records
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def append(self, *values):
+        self.buffer.append(values)
+        self.number_of_records += 1
+        if len(self.buffer) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.csv_wrtr.writerows(self.buffer)
+            del self.buffer[:]
+        self.data_file.flush()
+
+    def close(self):
+        if not self.data_file.closed:
+            self.flush()
+            self.data_file.close()
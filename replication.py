@@ -0,0 +1,250 @@
+from __future__ import division
+
+import random
+from math import sqrt
+from multiprocessing import Pool
+
+from simulation import Simulation
+from streams import RandomStreams
+from records import NullRecordSink
+from kpi import KPICollector
+from steady_state import t_quantile
+
+def replication_rng(seed, index):
+    """
+    Returns the random stream of replication index. Streams are seeded
+    from the string "seed:index", which random.Random hashes with
+    SHA-512, so they are reproducible and independent of each other
+    and of the global random module.
+    """
+    return random.Random('%s:%d' % (seed, index))
+
+def default_metrics(simulation, warmup=0.0):
+    """
+    Mean waiting time and number of completed services per station
+    (for patients arriving after warmup), and server utilisation.
+    """
+    metrics = {}
+    records = simulation.get_all_records()
+    for station in simulation.transitive_stations:
+        waits = [r.waiting_time for r in records
+                 if r.station == station.station_id and r.arrival_date >= warmup]
+        metrics['mean_wait_%d' % station.station_id] = sum(waits) / len(waits) if waits else float('nan')
+        metrics['completed_%d' % station.station_id] = len(waits)
+        if station.server_utilization is not None:
+            metrics['utilisation_%d' % station.station_id] = station.server_utilization
+    return metrics
+
+def run_replication(task):
+    """
+    Runs one replication in the current process and returns only its
+    metrics, so no patients or records travel back to the parent.
+    """
+    network, max_simulation_time, seed, index, metrics, records_path = task
+    Q = Simulation(network, rng=replication_rng(seed, index))
+    Q.simulate_until_max_time(max_simulation_time)
+    if records_path is not None:
+        Q.write_records_to_columns(records_path)
+    return index, metrics(Q)
+
+def run_kpi_replication(task):
+    """
+    Runs one replication keeping no records, only a KPICollector.
+    """
+    network, max_simulation_time, seed, index, windows = task
+    statistics = KPICollector(windows)
+    Q = Simulation(network, rng=replication_rng(seed, index),
+                   record_sink=NullRecordSink(), statistics=statistics)
+    Q.simulate_until_max_time(max_simulation_time)
+    return index, statistics
+
+def run_stream_replication(task):
+    """
+    Runs one replication with per-source RandomStreams.
+    """
+    key, network, max_simulation_time, stream_seed, antithetic, metrics, records_path = task
+    Q = Simulation(network, streams=RandomStreams(stream_seed, antithetic))
+    Q.simulate_until_max_time(max_simulation_time)
+    if records_path is not None:
+        Q.write_records_to_columns(records_path)
+    return key, metrics(Q)
+
+def run_tasks(function, tasks, processes=None):
+    """
+    Yields function(task) for every task as soon as it finishes, from a
+    process pool, or in this process when processes=1 (or when
+    there are no tasks, so nothing is spawned for nothing).
+    """
+    if processes == 1 or not tasks:
+        for task in tasks:
+            yield function(task)
+        return
+    pool = Pool(processes)
+    try:
+        for result in pool.imap_unordered(function, tasks):
+            yield result
+    finally:
+        pool.terminate()
+
+def iter_replications(network, max_simulation_time, replications, seed=0,
+                      processes=None, metrics=default_metrics):
+    """
+    Yields (index, metrics) for each replication as soon as it finishes.
+    The network and metrics function must be picklable unless
+    processes=1, in which case everything runs in this process.
+    """
+    tasks = [(network, max_simulation_time, seed, index, metrics, None)
+             for index in range(replications)]
+    return run_tasks(run_replication, tasks, processes)
+
+def cached_tasks(cache, tasks, keys):
+    """
+    Splits tasks into the results found in cache and the tasks still
+    to run, each of the latter writing its records into the cache when
+    it keeps records.
+    """
+    hits, missing = [], []
+    for task, key in zip(tasks, keys):
+        metrics = cache.get(key)
+        if metrics is not None:
+            hits.append((task, metrics))
+        else:
+            missing.append(task[:-1] + (cache.records_path(key),))
+    return hits, missing
+
+def replicate_kpis(network, max_simulation_time, replications, seed=0,
+                   processes=None, windows=None):
+    """
+    Runs replications that keep no records and returns their
+    KPICollectors merged into one.
+    """
+    tasks = [(network, max_simulation_time, seed, index, windows)
+             for index in range(replications)]
+    merged = KPICollector(windows)
+    for _, statistics in run_tasks(run_kpi_replication, tasks, processes):
+        merged.merge(statistics)
+    return merged
+
+def summarise(results):
+    """
+    Pools a list of per-replication metric dicts into
+    {metric: {'n', 'mean', 'sd', 'half_width'}}, half_width being
+    that of a 95% confidence interval on the mean.
+    """
+    summary = {}
+    for metric in sorted(set(key for result in results for key in result)):
+        values = [result[metric] for result in results
+                  if metric in result and result[metric] == result[metric]]
+        n = len(values)
+        mean = sum(values) / n if n else float('nan')
+        sd = sqrt(sum((v - mean) ** 2 for v in values) / (n - 1)) if n > 1 else float('nan')
+        summary[metric] = {'n': n, 'mean': mean, 'sd': sd,
+                           'half_width': t_quantile(n - 1) * sd / sqrt(n) if n > 1 else float('nan')}
+    return summary
+
+class Replications(object):
+    """
+    Per-replication metrics (in replication order) and their pooled summary.
+    """
+
+    def __init__(self, results):
+        self.results = [metrics for _, metrics in sorted(results, key=lambda result: result[0])]
+        self.summary = summarise(self.results)
+
+def replicate(network, max_simulation_time, replications, seed=0,
+              processes=None, metrics=default_metrics, cache=None):
+    """
+    Runs independent replications of network up to max_simulation_time
+    over a process pool and returns a Replications.
+
+    With cache (a ResultCache), replications already cached are read
+    back and only the missing indices are run, then cached. Networks or
+    metrics the cache cannot key (UserDefined, TimeDependent, callable
+    objects) are run without it.
+    """
+    keys = None
+    if cache is not None:
+        try:
+            keys = [cache.key(network, max_simulation_time, ('rng', seed, index), metrics)
+                    for index in range(replications)]
+        except ValueError:
+            keys = None
+    if keys is None:
+        return Replications(iter_replications(network, max_simulation_time, replications,
+                                              seed, processes, metrics))
+    tasks = [(network, max_simulation_time, seed, index, metrics, None)
+             for index in range(replications)]
+    hits, missing = cached_tasks(cache, tasks, keys)
+    results = [(task[3], metrics) for task, metrics in hits]
+    for index, result in run_tasks(run_replication, missing, processes):
+        cache.put(keys[index], result)
+        results.append((index, result))
+    return Replications(results)
+
+def average_pairs(results):
+    """
+    Averages consecutive (run, antithetic run) metric dicts into one
+    observation per pair.
+    """
+    return [{metric: (first[metric] + second[metric]) / 2 for metric in first if metric in second}
+            for first, second in zip(results[::2], results[1::2])]
+
+def differences(results, baseline):
+    return [{metric: result[metric] - base[metric] for metric in result if metric in base}
+            for result, base in zip(results, baseline)]
+
+class Comparison(object):
+    """
+    Replications of several configurations of one model.
+
+    summaries[j] pools the observations of configuration j and
+    differences[j] (j > 0) those of configuration j minus configuration
+    0, observation by observation. Each difference summary also reports
+    the runs spent on it and half_width * sqrt(runs), which is comparable
+    across modes: the smaller, the less replications a given precision costs.
+    """
+
+    def __init__(self, observations, runs):
+        self.observations = observations
+        self.runs = runs
+        self.summaries = [summarise(obs) for obs in observations]
+        self.differences = [None] + [summarise(differences(obs, observations[0]))
+                                     for obs in observations[1:]]
+        for summary in self.differences[1:]:
+            for metric in summary:
+                summary[metric]['runs'] = runs
+                summary[metric]['half_width_sqrt_runs'] = summary[metric]['half_width'] * sqrt(runs)
+
+def compare(networks, max_simulation_time, replications, seed=0,
+            common_random_numbers=True, antithetic=False,
+            processes=None, metrics=default_metrics):
+    """
+    Replicates every network in networks and compares them to networks[0].
+
+    With common_random_numbers, replication i of every configuration uses
+    the same per-source RandomStreams, so differences between
+    configurations are not blurred by sampling noise. With antithetic,
+    replications come in pairs, the second one run on the mirrored
+    streams of the first, and each pair is averaged into one observation.
+    """
+    if antithetic and replications % 2:
+        raise ValueError("Antithetic replications come in pairs.")
+
+    tasks = []
+    for index in range(replications):
+        stream_index = index // 2 if antithetic else index
+        for config, network in enumerate(networks):
+            if common_random_numbers:
+                stream_seed = '%s:%d' % (seed, stream_index)
+            else:
+                stream_seed = '%s:%d:%d' % (seed, stream_index, config)
+            tasks.append(((config, index), network, max_simulation_time, stream_seed,
+                          antithetic and index % 2 == 1, metrics, None))
+
+    results = [[None] * replications for _ in networks]
+    for (config, index), result in run_tasks(run_stream_replication, tasks, processes):
+        results[config][index] = result
+
+    if antithetic:
+        results = [average_pairs(config_results) for config_results in results]
+    return Comparison(results, replications)
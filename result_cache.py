@@ -0,0 +1,247 @@
+from __future__ import division
+
+import os
+import json
+import shutil
+import hashlib
+from functools import partial
+
+PACKAGE_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+_code_version = None
+
+def code_version():
+    """
+    Hash of the source of every module of the package, so that results
+    cached by an older version of the simulation are never returned.
+    """
+    global _code_version
+    if _code_version is None:
+        digest = hashlib.sha256()
+        for file_name in sorted(os.listdir(PACKAGE_DIRECTORY)):
+            if file_name.endswith('.py'):
+                digest.update(file_name.encode())
+                with open(os.path.join(PACKAGE_DIRECTORY, file_name), 'rb') as source_file:
+                    digest.update(source_file.read())
+        _code_version = digest.hexdigest()
+    return _code_version
+
+_file_digests = {}
+
+def file_digest(file_name):
+    """
+    SHA-256 of a file's contents, remembered while its size and
+    modification time are unchanged.
+    """
+    try:
+        status = os.stat(file_name)
+    except OSError:
+        raise ValueError("Cannot key Empirical file %r: it does not exist." % (file_name,))
+    stamp = (status.st_size, status.st_mtime_ns)
+    if _file_digests.get(file_name, (None,))[0] != stamp:
+        digest = hashlib.sha256()
+        with open(file_name, 'rb') as data_file:
+            digest.update(data_file.read())
+        _file_digests[file_name] = (stamp, digest.hexdigest())
+    return _file_digests[file_name][1]
+
+def canonical(value):
+    """
+    Turns create_network parameters, a Network or a seed spec into plain
+    JSON data that is identical for equal values: dict keys are sorted,
+    tuples become lists, floats are written with repr (so Inf and NaN
+    survive) and objects become their class name and attributes.
+    Empirical files are keyed by their contents, resolved against the
+    working directory as Simulation.import_empirical does.
+    Functions (UserDefined, TimeDependent) cannot be keyed.
+    """
+    if isinstance(value, dict):
+        return [[str(key), canonical(value[key])] for key in sorted(value, key=str)]
+    if (isinstance(value, (list, tuple)) and len(value) == 2
+            and value[0] == 'Empirical' and isinstance(value[1], str)):
+        return ['Empirical', file_digest(os.path.join(os.getcwd(), value[1]))]
+    if isinstance(value, (list, tuple)):
+        return [canonical(item) for item in value]
+    if isinstance(value, float):
+        return repr(value)
+    if value is None or isinstance(value, (str, int)):
+        return value
+    if callable(value):
+        raise ValueError("Cannot key %r: results of functions are not cached." % (value,))
+    if hasattr(value, '__dict__'):
+        return [type(value).__name__, canonical(vars(value))]
+    raise ValueError("Cannot key %r." % (value,))
+
+def code_key(code):
+    """
+    Bytecode, constants (nested functions included) and referenced
+    names of a code object.
+    """
+    constants = []
+    for constant in code.co_consts:
+        if hasattr(constant, 'co_code'):
+            constants.append(code_key(constant))
+        elif isinstance(constant, frozenset):
+            constants.append(sorted(repr(item) for item in constant))
+        else:
+            constants.append(repr(constant))
+    return [hashlib.sha256(code.co_code).hexdigest(), constants, list(code.co_names)]
+
+def bound_key(value):
+    if isinstance(value, partial) or hasattr(value, '__code__'):
+        return function_key(value)
+    return canonical(value)
+
+def function_key(function):
+    """
+    Keys a metrics function by what it computes rather than by its name,
+    so that two lambdas, or a function edited in a script, never share
+    results: its bytecode and constants, defaults and closure contents,
+    or for a functools.partial the function and its bound arguments.
+    Globals the function looks up are keyed by name only (those of the
+    package are covered by code_version). Raises ValueError for
+    callables it cannot inspect, which are then not cached.
+    """
+    if isinstance(function, partial):
+        return ['partial', function_key(function.func),
+                [bound_key(arg) for arg in function.args],
+                [[name, bound_key(function.keywords[name])] for name in sorted(function.keywords)]]
+    code = getattr(function, '__code__', None)
+    if code is None:
+        raise ValueError("Cannot key metrics %r: pass a function or a functools.partial of one." % (function,))
+    cells = []
+    for cell in function.__closure__ or ():
+        try:
+            cells.append(bound_key(cell.cell_contents))
+        except ValueError:
+            if cell.cell_contents is not function:
+                raise
+            cells.append('recursive')
+    kwdefaults = function.__kwdefaults__ or {}
+    return ['%s.%s' % (function.__module__, function.__qualname__), code_key(code),
+            [bound_key(value) for value in function.__defaults__ or ()],
+            [[name, bound_key(kwdefaults[name])] for name in sorted(kwdefaults)],
+            cells]
+
+class ResultCache(object):
+    """
+    Content-addressed on-disk store of per-replication results.
+
+    An entry is keyed by the SHA-256 of the canonical network (or its
+    parameters), the seed spec of the replication, the horizon, the
+    metrics function and the code version. It holds the metrics as JSON
+    and, with keep_records, the records in the columnar layout.
+
+    Entries are evicted least recently used first (by the modification
+    time of their JSON file, touched on every hit) once the cache holds
+    more than max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes=1 << 30, keep_records=False):
+        self.directory = os.path.abspath(os.path.expanduser(directory))
+        self.max_bytes = max_bytes
+        self.keep_records = keep_records
+        self.total_bytes = None
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    def key(self, network, max_simulation_time, seed_spec, metrics):
+        description = json.dumps([canonical(network), canonical(max_simulation_time),
+                                  canonical(seed_spec), function_key(metrics), code_version()],
+                                 separators=(',', ':'))
+        return hashlib.sha256(description.encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def records_path(self, key):
+        """
+        Directory the records of key are written to, with keep_records.
+        """
+        if not self.keep_records:
+            return None
+        return self.path(key) + '.records'
+
+    def get(self, key):
+        """
+        Returns the cached metrics of key, or None.
+        """
+        file_name = self.path(key) + '.json'
+        try:
+            with open(file_name, 'r') as entry_file:
+                metrics = json.load(entry_file)
+        except (IOError, OSError, ValueError):
+            return None
+        if self.keep_records and not os.path.isdir(self.records_path(key)):
+            return None
+        os.utime(file_name, None)
+        return metrics
+
+    def put(self, key, metrics):
+        file_name = self.path(key) + '.json'
+        if not os.path.isdir(os.path.dirname(file_name)):
+            os.makedirs(os.path.dirname(file_name))
+        # written aside and renamed, so readers never see half an entry
+        with open(file_name + '.tmp', 'w') as entry_file:
+            json.dump(metrics, entry_file)
+        os.replace(file_name + '.tmp', file_name)
+
+        if self.total_bytes is None:
+            self.total_bytes = sum(size for _, size, _ in self.entries())
+        else:
+            self.total_bytes += self.entry_size(key)
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def records(self, key):
+        """
+        Memory-maps the cached records of key (see columnar.load_columns).
+        """
+        from columnar import load_columns
+        return load_columns(self.path(key) + '.records')
+
+    def entries(self):
+        """
+        Returns [(last use, size, key)] of every entry.
+        """
+        entries = []
+        for prefix in os.listdir(self.directory):
+            prefix_directory = os.path.join(self.directory, prefix)
+            if not os.path.isdir(prefix_directory):
+                continue
+            for file_name in os.listdir(prefix_directory):
+                if not file_name.endswith('.json'):
+                    continue
+                key = file_name[:-len('.json')]
+                path = os.path.join(prefix_directory, file_name)
+                entries.append((os.path.getmtime(path), self.entry_size(key), key))
+        return entries
+
+    def entry_size(self, key):
+        path = self.path(key)
+        size = os.path.getsize(path + '.json')
+        if os.path.isdir(path + '.records'):
+            size += sum(os.path.getsize(os.path.join(path + '.records', name))
+                        for name in os.listdir(path + '.records'))
+        return size
+
+    def evict(self):
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            self.remove(key)
+            total -= size
+        self.total_bytes = total
+
+    def remove(self, key):
+        path = self.path(key)
+        if os.path.exists(path + '.json'):
+            os.remove(path + '.json')
+        shutil.rmtree(path + '.records', ignore_errors=True)
+
+    def clear(self):
+        for _, _, key in self.entries():
+            self.remove(key)
+        self.total_bytes = 0
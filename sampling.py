@@ -0,0 +1,86 @@
+from __future__ import division
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+KINDS = {'Arr': 0, 'Ser': 1}
+
+def truncated_normal_block(generator, mean, sd, size):
+    """
+    Draws size samples of a Normal(mean, sd) truncated at 0, rejecting
+    non-positive samples a whole block at a time.
+    """
+    samples = generator.normal(mean, sd, size)
+    samples = samples[samples > 0.0]
+    while len(samples) < size:
+        more = generator.normal(mean, sd, size)
+        samples = numpy.concatenate([samples, more[more > 0.0]])
+    return samples[:size]
+
+class BlockSampler(object):
+    """
+    Callable returning one sample at a time from blocks drawn lazily
+    by draw_block(size). Blocks are kept as Python lists so that a
+    sample costs a list pop rather than a NumPy scalar. generator is the
+    NumPy Generator draw_block draws from, kept for snapshots.
+    """
+
+    def __init__(self, draw_block, block_size, generator=None):
+        self.draw_block = draw_block
+        self.block_size = block_size
+        self.generator = generator
+        self.block = []
+
+    def __call__(self, current_time=None):
+        if not self.block:
+            self.block = self.draw_block(self.block_size).tolist()
+        return self.block.pop()
+
+class BlockSampling(object):
+    """
+    Pre-draws inter-arrival and service times in blocks of block_size
+    from one NumPy Generator per (kind, station, clss) source.
+
+    Generators are derived from SeedSequence(seed) with the source as
+    spawn key, so every source has its own reproducible stream. Specs
+    that cannot be pre-drawn (Deterministic, UserDefined, TimeDependent)
+    are left to Simulation.find_distributions.
+    """
+
+    def __init__(self, seed=0, block_size=4096):
+        if numpy is None:
+            raise ImportError("BlockSampling requires numpy.")
+        self.seed = seed
+        self.block_size = block_size
+
+    def generator(self, kind, station, clss):
+        return numpy.random.default_rng(numpy.random.SeedSequence(
+            self.seed, spawn_key=(KINDS[kind], station, clss)))
+
+    def sampler(self, kind, station, clss, dist, values=None):
+        """
+        Returns a BlockSampler for the create_network spec dist of one
+        source, or None if dist is not pre-drawn. values are the samples
+        of an Empirical spec, already read from file if need be.
+        """
+        if dist == 'NoArrivals' or dist[0] not in ('Uniform', 'Exponential', 'Normal',
+                                                   'Custom', 'Empirical'):
+            return None
+        generator = self.generator(kind, station, clss)
+
+        if dist[0] == 'Uniform':
+            draw_block = lambda size: generator.uniform(dist[1], dist[2], size)
+        if dist[0] == 'Exponential':
+            draw_block = lambda size: generator.exponential(1.0 / dist[1], size)
+        if dist[0] == 'Normal':
+            draw_block = lambda size: truncated_normal_block(generator, dist[1], dist[2], size)
+        if dist[0] == 'Custom':
+            array, probs = numpy.asarray(dist[1], dtype=float), numpy.asarray(dist[2], dtype=float)
+            draw_block = lambda size: generator.choice(array, size, p=probs)
+        if dist[0] == 'Empirical':
+            array = numpy.asarray(values if values is not None else dist[1], dtype=float)
+            draw_block = lambda size: generator.choice(array, size)
+
+        return BlockSampler(draw_block, self.block_size, generator)
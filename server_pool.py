@@ -0,0 +1,50 @@
+from __future__ import division
+
+from heapq import heappush, heappop
+from itertools import count
+
+class ServerPool(object):
+    """
+    Indexed view over the servers of one station.
+
+    Free servers are kept in a min-heap on id_number, so the lowest
+    numbered free server is always assigned first. Busy servers are kept
+    in a min-heap on next_end_service_date; entries of servers that have
+    since been released are discarded lazily.
+    """
+
+    def __init__(self, servers):
+        self.servers = servers
+        self.free = [(server.id_number, server) for server in servers]
+        self.completions = []
+        self.sequence = count()
+
+    def has_free(self):
+        return len(self.free) > 0
+
+    def acquire(self):
+        """
+        Takes the lowest numbered free server out of the pool.
+        """
+        return heappop(self.free)[1]
+
+    def schedule_completion(self, server):
+        heappush(self.completions,
+            (server.next_end_service_date, next(self.sequence), server))
+
+    def release(self, server):
+        """
+        Puts server back into the pool of free servers.
+        """
+        heappush(self.free, (server.id_number, server))
+
+    def next_completion_date(self):
+        """
+        Returns the earliest next_end_service_date among busy servers.
+        """
+        while self.completions:
+            date, _, server = self.completions[0]
+            if server.busy and server.next_end_service_date == date:
+                return date
+            heappop(self.completions)
+        return float('Inf')
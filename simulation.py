@@ -1,98 +1,201 @@
 from __future__ import division
 import os
-import pdb
-import tqdm
 import random
-from random import (expovariate, uniform, triangular, gammavariate, lognormvariate, weibullvariate)
-from csv import writer, reader
-from decimal import getcontext
-from itertools import cycle
 
-import argparse
-parser = argparse.ArgumentParser(description='Gaussian Process')
-parser.add_argument('--case',type=str, default='class_change')
-parser.add_argument('--path',type=str, default = './all_records.csv')
-
-parser.add_argument('--write_csv',type=bool, default = True)
-
-args = parser.parse_args()
-
-import matplotlib
-matplotlib.use("TkAgg")
-
-from utils import random_choice, truncated_normal
-from params_to_network import create_network
+from distributions import compile_distribution, empirical_cache
 from station import ArrivalStation, Station, ExitStation
+from individual import PatientPool
+from event_calendar import EventCalendar
+from alias import routing_tables, class_change_tables
+from records import RecordStore, CSVRecordSink
+from columnar import ColumnarRecordSink
+from steady_state import ObservationSeries, PrecisionResult, precision
+from snapshot import SimulationSnapshot
+from telemetry import Telemetry, ProgressBar
 
 class Simulation(object):
 
-    def __init__(self, network, station_class=None, arrival_station_class=None):
-
+    def __init__(self, network, station_class=None, arrival_station_class=None, 
+                 recycle_patients=False, record_sink=None, drop_exited_patients=False, rng=None,
+                 streams=None, block_sampling=None, statistics=None,
+                 time_weighted=False, bucket_width=None, profiler=None):
+        """
+        With recycle_patients, Patient objects that exit or are rejected
+        are reused for new arrivals instead of being kept by the
+        ExitStation; their records are unaffected.
+
+        Records are written to record_sink as they happen (an in-memory
+        RecordStore by default, or e.g. a CSVRecordSink). With
+        drop_exited_patients the ExitStation does not keep patients, so
+        memory stays flat when records are streamed out.
+
+        All draws come from rng (a random.Random), or from the global
+        random module when it is not given. With streams (a RandomStreams)
+        every arrival, service, routing and class change source, and the
+        tie-breaking, draws from its own stream instead. With
+        block_sampling (a BlockSampling) inter-arrival and service times
+        are pre-drawn in NumPy blocks wherever the distribution allows.
+        statistics (e.g. a KPICollector) is fed every record alongside
+        record_sink; pass record_sink=NullRecordSink() to keep only it.
+        With time_weighted every station integrates its number of patients
+        and busy servers over time (see time_averages), split into buckets
+        of bucket_width (e.g. 60 for hourly profiles) when that is given.
+        A profiler (a Profiler) instruments this simulation's event loop.
+        """
         self.network = network
+        self.rng = rng if rng is not None else random
+        self.streams = streams
+        self.block_sampling = block_sampling
+        self.recycle_patients = recycle_patients
+        self.patient_pool = PatientPool()
 
         self.inter_arrival_times = self.find_times_dict('Arr')
         self.service_times = self.find_times_dict('Ser')
 
         self.priority_lev = self.network.priority_lev
-
+        self.routing_tables = routing_tables(network)
+        self.class_change_tables = class_change_tables(network)
+
+        self.changed_stations = []
+        self.current_time = 0.0
+        self.records = record_sink if record_sink is not None else RecordStore()
+        self.statistics = statistics
+        self.record_writers = [self.records] + ([statistics] if statistics is not None else [])
+        self.time_weighted = time_weighted or bucket_width is not None
+        self.bucket_width = bucket_width
         self.transitive_stations = [Station(i+1, self) for i in range(network.number_of_stations)] 
-        self.all_stations        = ([ArrivalStation(self)] + self.transitive_stations + [ExitStation()]) 
+        self.all_stations        = ([ArrivalStation(self)] + self.transitive_stations 
+            + [ExitStation(self.patient_pool if recycle_patients else None, 
+                           keep_patients=not drop_exited_patients)]) 
+        self.event_calendar = EventCalendar(self.all_stations, self.random_stream('Ties'))
+        self.profiler = profiler.attach(self) if profiler is not None else None
 
-    def simulate_until_max_time(self, max_simulation_time, progress_bar=False):
+    def simulate_until_max_time(self, max_simulation_time, progress_bar=False, telemetry=None):
+        """
+        Runs until max_simulation_time. With telemetry (a Telemetry),
+        progress samples are published while the run goes; progress_bar
+        shows a tqdm bar through one. Without either, the event loop
+        does nothing but events.
+        """
+        if progress_bar and telemetry is None:
+            telemetry = Telemetry(callback=ProgressBar(max_simulation_time), interval=0.1)
 
         next_active_station = self.find_next_active_station()
 
         current_time = next_active_station.next_event_date
 
-        if progress_bar:
-            self.progress_bar = tqdm.tqdm(total=max_simulation_time)
-
-        while current_time < max_simulation_time:
-            next_active_station = self.event_and_return_nextstation(next_active_station, current_time)
+        if telemetry is None:
+            while current_time < max_simulation_time:
+                next_active_station = self.event_and_return_nextstation(next_active_station, current_time)
+                current_time = next_active_station.next_event_date
+        else:
+            countdown = telemetry.start(self, min(current_time, max_simulation_time))
+            while current_time < max_simulation_time:
+                next_active_station = self.event_and_return_nextstation(next_active_station, current_time)
+                current_time = next_active_station.next_event_date
+                countdown -= 1
+                if not countdown:
+                    countdown = telemetry.tick(min(current_time, max_simulation_time))
 
-            if progress_bar:
-                remaining_time = max_simulation_time - self.progress_bar.n
-                time_increment = next_active_station.next_event_date - current_time
-                self.progress_bar.update(min(time_increment, remaining_time))
+        self.wrap_up_servers(max_simulation_time)
+        for record_writer in self.record_writers:
+            record_writer.flush()
 
-            current_time = next_active_station.next_event_date
+        if telemetry is not None:
+            telemetry.finish(max_simulation_time, countdown)
 
-        self.wrap_up_servers(max_simulation_time)
+    def simulate_until_precision(self, max_simulation_time, relative_half_width=0.05,
+                                 fields=('waiting_time',), station=None, check_interval=None,
+                                 number_of_batches=20, min_batch_size=10):
+        """
+        Runs until the batch means confidence intervals of every record
+        field in fields (pooled over all stations, or of station) have a
+        relative half-width of at most relative_half_width, with the
+        warm-up deleted by MSER-5, or until max_simulation_time.
+
+        Precision is checked every check_interval of simulated time
+        (a fiftieth of max_simulation_time by default). Returns a
+        PrecisionResult; converged is False if the time cap was hit.
+        """
+        if check_interval is None:
+            check_interval = max_simulation_time / 50
+        series = ObservationSeries(fields, station)
+        self.record_writers.append(series)
 
-        if progress_bar:
-            remaining_time = max(max_simulation_time - self.progress_bar.n, 0)
-            self.progress_bar.update(remaining_time)
-            self.progress_bar.close()
+        next_active_station = self.find_next_active_station()
+        current_time = next_active_station.next_event_date
+        check_date = 0.0
+        converged = False
+        while not converged and check_date < max_simulation_time:
+            check_date = min(check_date + check_interval, max_simulation_time)
+            while current_time < check_date:
+                next_active_station = self.event_and_return_nextstation(next_active_station, current_time)
+                current_time = next_active_station.next_event_date
+            converged, warmup, estimates = precision(series, relative_half_width,
+                                                     number_of_batches, min_batch_size)
+
+        self.record_writers.remove(series)
+        self.wrap_up_servers(check_date)
+        for record_writer in self.record_writers:
+            record_writer.flush()
+
+        warmup_date = series.exit_dates[warmup - 1] if warmup else 0.0
+        return PrecisionResult(converged, check_date, warmup, warmup_date, len(series), estimates)
 
     def find_next_active_station(self):
         """
         Returns the next active station:
         """
-        next_event_date = min([station.next_event_date 
-                            for station in self.all_stations])
-
-        next_active_station_indices = [i 
-            for i, station in enumerate(self.all_stations) 
-            if station.next_event_date == next_event_date]
-
-        if len(next_active_station_indices) > 1:
-            return self.all_stations[random_choice(next_active_station_indices)]
+        return self.event_calendar.next_active_station()
 
-        return self.all_stations[next_active_station_indices[0]]
+    def station_changed(self, station):
+        """
+        Marks a transitive station whose servers changed,
+        so that it is rescheduled after the current event.
+        """
+        self.changed_stations.append(station)
 
     def event_and_return_nextstation(self, next_active_station, current_time):
         next_active_station.have_event()
+        self.event_calendar.schedule(next_active_station)
 
-        for station in self.transitive_stations:
+        for station in self.changed_stations:
             station.update_next_event_date(current_time)
+            self.event_calendar.schedule(station)
+        del self.changed_stations[:]
 
         return self.find_next_active_station()
 
     def wrap_up_servers(self, current_time):
+        self.current_time = current_time
         for station in self.transitive_stations:
             station.wrap_up_servers(current_time)
             station.find_server_utilization()
 
+    def time_averages(self):
+        """
+        Returns the time averages of every transitive station,
+        keyed by station_id (needs time_weighted).
+        """
+        if not self.time_weighted:
+            raise ValueError("Time averages need Simulation(..., time_weighted=True).")
+        return {station.station_id: station.time_averages() for station in self.transitive_stations}
+
+    def snapshot(self):
+        """
+        Returns a SimulationSnapshot of the state at the last wrap up,
+        which restore() turns into a new Simulation continuing from it.
+        """
+        return SimulationSnapshot.take(self)
+
+    def random_stream(self, *key):
+        """
+        Returns the random stream of one source of randomness.
+        """
+        if self.streams is None:
+            return self.rng
+        return self.streams.stream(*key)
+
     def find_times_dict(self, kind):
 
         return {station + 1: {clss: self.find_distributions(station, clss, kind) 
@@ -106,249 +209,77 @@ class Simulation(object):
             return self.network.patients[clss].service_dist[station]
 
     def find_distributions(self, station, clss, kind):
+        """
+        Compiles the distribution of one source into a sampler,
+        called as sampler(current_time).
+        """
+        rng = self.random_stream(kind, station + 1, clss)
+        dist = self.source(station, clss, kind)
+
+        if self.block_sampling is not None:
+            values = None
+            if dist != 'NoArrivals' and dist[0] == 'Empirical' and isinstance(dist[1], str):
+                values = self.import_empirical(dist[1])
+            sampler = self.block_sampling.sampler(kind, station + 1, clss, dist, values)
+            if sampler is not None:
+                return sampler
 
-        if self.source(station, clss, kind) == 'NoArrivals':
-            return lambda : float('Inf')
-        if self.source(station, clss, kind)[0] == 'Uniform':
-            return lambda : uniform(self.source(station, clss, kind)[1], 
-                                    self.source(station, clss, kind)[2])
-        if self.source(station, clss, kind)[0] == 'Deterministic':
-            return lambda : self.source(station, clss, kind)[1]
-        if self.source(station, clss, kind)[0] == 'Exponential':
-            return lambda : expovariate(self.source(station, clss, kind)[1])
-        if self.source(station, clss, kind)[0] == 'Normal':
-            return lambda : truncated_normal(self.source(station, clss, kind)[1], 
-                                             self.source(station, clss, kind)[2])
-        if self.source(station, clss, kind)[0] == 'Custom':
-            return lambda : random_choice(array = self.source(station, clss, kind)[1], 
-                                          probs = self.source(station, clss, kind)[2])
-
-        if self.source(station, clss, kind)[0] == 'UserDefined':
-            return lambda : self.check_userdef_dist(self.source(station, clss, kind)[1])
-
-        if self.source(station, clss, kind)[0] == 'TimeDependent':
-            return lambda t : self.check_timedependent_dist(self.source(station, clss, kind)[1], kind, t)
-
-        if self.source(station, clss, kind)[0] == 'Empirical':
-            if isinstance(self.source(station, clss, kind)[1], str):
-                return lambda : random_choice(self.import_empirical(self.source(station, clss, kind)[1]))
-            return lambda : random_choice(self.source(station, clss, kind)[1])
-
-    def check_userdef_dist(self, func):
-        sample = func()
-        if not isinstance(sample, float) or sample < 0:
-            raise ValueError("UserDefined func must return positive float.")
-        return sample
-
-    def check_timedependent_dist(self, func, kind, current_time):
-        sample = func(current_time)
-        if kind in ['Arr', 'Ser'] and not isinstance(sample, float) or sample < 0:
-            raise ValueError("TimeDependent func must return positive float.")
-        return sample
+        return compile_distribution(dist, rng)
 
     def import_empirical(self, dist_file):
-        root = os.getcwd()
-        file_name = root + '/' + dist_file
-        empirical_file = open(file_name, 'r')
-        rdr = reader(empirical_file)
-        empirical_dist = [[float(x) for x in row] for row in rdr][0]
-        empirical_file.close()
-        return empirical_dist
+        return empirical_cache.load(os.path.join(os.getcwd(), dist_file))
 
     def get_all_patients(self):
         return [patient for station in self.all_stations[1:] 
             for patient in station.all_patients 
-            if len(patient.data_records) > 0]
+            if patient.number_of_records > 0]
 
-    def get_all_records(self):
-        records = []
-        for patient in self.get_all_patients():
-            for record in patient.data_records:
-                records.append(record)
+    def get_all_records(self, order='written'):
+        """
+        Returns the records in the order services completed, or with
+        order='patient' grouped by patient as get_all_patients lists them
+        (the order of the former per-patient record lists), patients no
+        longer in the simulation coming last.
+        """
+        if not isinstance(self.records, RecordStore):
+            raise ValueError("Records were streamed to a sink and are not kept in memory.")
+        if order not in ('written', 'patient'):
+            raise ValueError("order must be 'written' or 'patient', not %r." % (order,))
+        records = self.records.rows()
+        if order == 'patient':
+            by_patient = {}
+            for record in records:
+                by_patient.setdefault(record.id_number, []).append(record)
+            records = []
+            for patient in self.get_all_patients():
+                records.extend(by_patient.pop(patient.id_number, []))
+            for remaining in by_patient.values():
+                records.extend(remaining)
         self.all_records = records
         return records
 
-    def write_records_to_file(self, file_name, headers=True):
+    def write_records_to_file(self, file_name, headers=True, order='written'):
         """
-        Writes the records for all patient to a csv file
+        Writes the records for all patient to a csv file, in the order
+        of get_all_records
         """
         root = os.getcwd()
         directory = os.path.join(root, file_name)
-        data_file = open('%s' % directory, 'w')
-        csv_wrtr = writer(data_file)
-        if headers:
-            csv_wrtr.writerow(['I.D. Number',
-                               'Customer Class',
-                               'Node',
-                               'Arrival Date',
-                               'Waiting Time',
-                               'Service Start Date',
-                               'Service Time',
-                               'Service End Date',
-                               'Exit Date',
-                               'Destination',
-                               'Queue Size at Arrival',
-                               'Queue Size at Departure'])
-        records = self.get_all_records()
-        for row in records:
-            csv_wrtr.writerow(row)
-        data_file.close()
+        records = self.get_all_records(order)
+        with CSVRecordSink(directory, headers=headers) as sink:
+            for row in records:
+                sink.append(*row)
 
-if __name__ == "__main__":
+    def write_records_to_columns(self, directory):
+        """
+        Writes the records as one memory-mappable .npy file per field
+        """
+        with ColumnarRecordSink(os.path.join(os.getcwd(), directory)) as sink:
+            for column in zip(*self.records.columns):
+                sink.append(*column)
 
-    if args.case == "basic_3":
-        N = create_network(
-            Arrival_distributions=[['Exponential', 0.2]],
-            Service_distributions=[['Exponential', 0.1]],
-            Number_of_servers=[3])
-
-        random.seed(1)
-        Q = Simulation(N)
-        Q.simulate_until_max_time(1440)
-        recs = Q.get_all_records()
-        servicetimes = [r.service_time for r in recs]
-        waits = [r.waiting_time for r in recs]
-
-        import matplotlib.pyplot as plt
-        plt.hist(waits)
-        plt.show()
-    
-    if args.case == "basic_4":
-        N = create_network(
-            Arrival_distributions=[['Exponential', 0.2]],
-            Service_distributions=[['Exponential', 0.1]],
-            Number_of_servers=[4])
-
-        average_waits = []
-        for trial in range(10):
-            random.seed(trial)
-            Q = Simulation(N)
-            Q.simulate_until_max_time(1640)
-            recs = Q.get_all_records()
-            waits = [r.waiting_time for r in recs if r.arrival_date > 100 and r.arrival_date < 1540]
-            mean_wait = sum(waits) / len(waits)
-            average_waits.append(mean_wait)
-
-        print(sum(average_waits) / len(average_waits))
-
-    if args.case == "homo_class_with_transition":
-        N = create_network(
-            Arrival_distributions=[['Exponential', 0.3],
-                                   ['Exponential', 0.2],
-                                   'NoArrivals'],
-            Service_distributions=[['Exponential', 1.0],
-                                   ['Exponential', 0.4],
-                                   ['Exponential', 0.5]],
-            Transition_matrices=[[0.0, 0.3, 0.7],
-                                 [0.0, 0.0, 1.0],
-                                 [0.0, 0.0, 0.0]],
-            Number_of_servers=[1, 2, 2]
-        )
-
-        completed_pats = []
-        for trial in range(10):
-            random.seed(trial)
-            Q = Simulation(N)
-            Q.simulate_until_max_time(200)
-            recs = Q.get_all_records()
-            num_completed = len([r for r in recs if r.station==3 and r.arrival_date < 180])
-            completed_pats.append(num_completed)
-
-        print(sum(completed_pats) / len(completed_pats))
-
-    if args.case == "hetero_class_with_transition":
-        N = create_network(
-            Arrival_distributions={'Class 0': [['Exponential', 1.0],
-                                               'NoArrivals',
-                                               'NoArrivals'],
-                                   'Class 1': [['Exponential', 2.0],
-                                               'NoArrivals',
-                                               'NoArrivals']},
-            Service_distributions={'Class 0': [['Exponential', 4.0],
-                                               ['Exponential', 1.0],
-                                               ['Deterministic', 0.0]],
-                                   'Class 1': [['Exponential', 6.0],
-                                               ['Deterministic', 0.0],
-                                               ['Exponential', 1.0]]},
-            Transition_matrices={'Class 0': [[0.0, 1.0, 0.0],
-                                             [0.0, 0.0, 0.0],
-                                             [0.0, 0.0, 0.0]],
-                                 'Class 1': [[0.0, 0.0, 1.0],
-                                             [0.0, 0.0, 0.0],
-                                             [0.0, 0.0, 0.0]]},
-            Number_of_servers=[1, 2, 3],
-        )
-
-        Q = Simulation(N)
-        Q.simulate_until_max_time(9)
-        recs = Q.get_all_records()
-        visited_by_babies = {1, 2}
-        print(set([r.station for r in recs 
-            if r.patient_class==0]) == visited_by_babies)
-    
-        average_waits_1 = []
-        average_waits_2 = []
-        average_waits_3 = []
-        for trial in range(16):
-            random.seed(trial)
-            Q = Simulation(N)
-            Q.simulate_until_max_time(30)
-            recs = Q.get_all_records()
-            waits1 = [r.waiting_time for r in recs if r.station==1 and r.arrival_date > 3 and r.arrival_date < 27]
-            waits2 = [r.waiting_time for r in recs if r.station==2 and r.arrival_date > 3 and r.arrival_date < 27]
-            waits3 = [r.waiting_time for r in recs if r.station==3 and r.arrival_date > 3 and r.arrival_date < 27]
-            average_waits_1.append(sum(waits1) / len(waits1))
-            average_waits_2.append(sum(waits2) / len(waits2))
-            average_waits_3.append(sum(waits3) / len(waits3))
-        
-        print(sum(average_waits_1) / len(average_waits_1))
-        print(sum(average_waits_2) / len(average_waits_2))
-        print(sum(average_waits_3) / len(average_waits_3))
-
-    if args.case == "priority":
-        N = create_network(
-            Arrival_distributions={'Class 0': [['Exponential', 5]],
-                                   'Class 1': [['Exponential', 5]]},
-            Service_distributions={'Class 0': [['Exponential', 10]],
-                                   'Class 1': [['Exponential', 10]]},
-            Priority_classes={'Class 0': 0, 'Class 1': 1},
-            Number_of_servers=[1]
-        )
-        random.seed(1)
-        Q = Simulation(N)
-        Q.simulate_until_max_time(100.0)
-        recs = Q.get_all_records()
-        waits_0 = [r.waiting_time 
-            for r in recs if r.patient_class==0]
-        print(sum(waits_0)/len(waits_0))
-        waits_1 = [r.waiting_time 
-            for r in recs if r.patient_class==1]
-        print(sum(waits_1)/len(waits_1))
-
-    if args.case == "class_change":
-        N = create_network(
-            Arrival_distributions={'Class 0': [['Exponential', 5]],
-                                   'Class 1': ['NoArrivals'],
-                                   'Class 2': ['NoArrivals']},
-            Service_distributions={'Class 0': [['Exponential', 10]],
-                                   'Class 1': [['Exponential', 10]],
-                                   'Class 2': [['Exponential', 10]]},
-            Transition_matrices={'Class 0': [[1.0]],
-                                 'Class 1': [[1.0]],
-                                 'Class 2': [[1.0]]},
-            Class_change_matrices={'Station 1': [[0.0, 0.5, 0.5],
-                                              [0.5, 0.0, 0.5],
-                                              [0.5, 0.5, 0.0]]},
-            Number_of_servers=[1]
-        )      
-        from collections import Counter
-        random.seed(1)
-        Q = Simulation(N)
-        Q.simulate_until_max_time(50.0)
-        recs = Q.get_all_records()
-        print(Counter([r.patient_class for r in recs]))
-    
-    if args.write_csv:
-        Q.write_records_to_file(args.path) 
-
-    # pdb.set_trace()
\ No newline at end of file
+if __name__ == "__main__":
+    # the example cases now live in examples.py, behind cli.py
+    import sys
+    from cli import main
+    main(['run'] + sys.argv[1:])
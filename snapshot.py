@@ -0,0 +1,301 @@
+from __future__ import division
+
+import copy
+import pickle
+import random
+from array import array
+from collections import deque
+from heapq import heapify
+from itertools import count
+
+from individual import Patient
+from event_calendar import EventCalendar
+from records import RecordStore
+from streams import RandomStreams, AntitheticRandom
+from kpi import TimeWeighted
+
+PATIENT_FIELDS = [field for field in Patient.__slots__ if field != 'server']
+SERVER_FIELDS = ['busy', 'start_date', 'busy_time', 'total_time',
+                 'next_end_service_date', 'partial_busy_time']
+TIME_WEIGHTED_FIELDS = ['value', 'start_date', 'last_date', 'area', 'bucket_width', 'buckets']
+
+def peek_count(counter):
+    """
+    Returns the next value of an itertools.count and a fresh counter
+    starting at it, to be used in its place.
+    """
+    value = next(counter)
+    return value, count(value)
+
+def time_weighted_state(tracker):
+    if tracker is None:
+        return None
+    return tuple(copy.copy(getattr(tracker, field)) for field in TIME_WEIGHTED_FIELDS)
+
+def restore_time_weighted(state):
+    if state is None:
+        return None
+    tracker = TimeWeighted()
+    for field, value in zip(TIME_WEIGHTED_FIELDS, state):
+        setattr(tracker, field, copy.copy(value))
+    return tracker
+
+class SimulationSnapshot(object):
+    """
+    Complete state of a Simulation at the date of its last wrap up (the
+    end of simulate_until_max_time), held as plain data: patients,
+    queues, servers, pending arrivals, the event calendar, random
+    states, records and statistics.
+
+    Samplers are not part of the state. restore builds a new Simulation
+    from a network, which compiles them afresh, then puts the state and
+    the random generator states back, so a snapshot can be restored any
+    number of times (forked), saved to disk and restored against a
+    variant network with the same stations, classes and servers.
+    UserDefined and TimeDependent functions keep their own state.
+    """
+
+    def __init__(self, state, network=None):
+        self.state = state
+        self.network = network
+
+    @property
+    def date(self):
+        return self.state['current_time']
+
+    @classmethod
+    def take(cls, simulation):
+        patients = {}
+
+        def patient_index(patient):
+            if patient is None:
+                return None
+            if patient not in patients:
+                patients[patient] = len(patients)
+            return patients[patient]
+
+        arrival_station = simulation.all_stations[0]
+        exit_station = simulation.all_stations[-1]
+
+        stations = []
+        for station in simulation.transitive_stations:
+            queue = station.patients
+            sequence, queue.sequence = peek_count(queue.sequence)
+            servers = None
+            if hasattr(station, 'servers'):
+                servers = [(tuple(getattr(server, field) for field in SERVER_FIELDS),
+                            patient_index(server.patient),
+                            time_weighted_state(server.busy_profile))
+                           for server in station.servers]
+            stations.append({
+                'number_of_patients': station.number_of_patients,
+                'next_event_date': station.next_event_date,
+                'servers': servers,
+                'waiting': [[patient_index(p) for p in waiting] for waiting in queue.waiting],
+                'in_service': {date: [patient_index(p) for p in in_service]
+                               for date, in_service in queue.in_service.items()},
+                'keys': [(patient_index(p), key) for p, key in queue.keys.items()],
+                'sequence': sequence,
+                'occupancy': time_weighted_state(station.occupancy),
+                'busy_servers': (time_weighted_state(station.busy_servers)
+                                 if station.busy_servers is not station.occupancy else None),
+                'server_utilization': getattr(station, 'server_utilization', None),
+            })
+
+        state = {
+            'current_time': simulation.current_time,
+            'number_of_stations': simulation.network.number_of_stations,
+            'number_of_classes': simulation.network.number_of_classes,
+            'number_of_servers': [station.number_of_servers for station in simulation.transitive_stations],
+            'recycle_patients': simulation.recycle_patients,
+            'keep_patients': exit_station.keep_patients,
+            'time_weighted': simulation.time_weighted,
+            'bucket_width': simulation.bucket_width,
+            'arrivals': {
+                'number_of_patients': arrival_station.number_of_patients,
+                'number_of_accepted_patients': arrival_station.number_of_accepted_patients,
+                'event_dates_dict': copy.deepcopy(arrival_station.event_dates_dict),
+                'rejection_dict': copy.deepcopy(arrival_station.rejection_dict),
+                'heap': list(arrival_station.arrival_scheduler.heap),
+            },
+            'stations': stations,
+            'exited': [patient_index(p) for p in exit_station.all_patients],
+            'number_exited': exit_station.number_of_patients,
+            'pool': [patient_index(p) for p in simulation.patient_pool.free],
+            'random': cls.random_state(simulation),
+            'records': ([array(column.typecode, column) for column in simulation.records.columns]
+                        if isinstance(simulation.records, RecordStore) else None),
+            'statistics': copy.deepcopy(simulation.statistics),
+        }
+        # every patient has been indexed by now
+        state['patients'] = [tuple(getattr(p, field) for field in PATIENT_FIELDS)
+                             for p in sorted(patients, key=patients.get)]
+        return cls(state, simulation.network)
+
+    @staticmethod
+    def random_state(simulation):
+        state = {}
+        if simulation.streams is not None:
+            state['streams'] = (simulation.streams.seed, simulation.streams.antithetic,
+                                {key: stream.getstate() for key, stream in simulation.streams.streams.items()})
+        else:
+            state['rng'] = (simulation.rng is random, isinstance(simulation.rng, AntitheticRandom),
+                            simulation.rng.getstate())
+        if simulation.block_sampling is not None:
+            blocks = {}
+            for kind, samplers in (('Arr', simulation.inter_arrival_times), ('Ser', simulation.service_times)):
+                for station in samplers:
+                    for clss, sampler in samplers[station].items():
+                        if getattr(sampler, 'generator', None) is not None:
+                            blocks[kind, station, clss] = (sampler.generator.bit_generator.state,
+                                                           list(sampler.block))
+            state['block_sampling'] = (simulation.block_sampling.seed,
+                                       simulation.block_sampling.block_size, blocks)
+        return state
+
+    def save(self, file_name):
+        """
+        Writes the state (not the network) to file_name.
+        """
+        with open(file_name, 'wb') as snapshot_file:
+            pickle.dump(self.state, snapshot_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, file_name, network=None):
+        with open(file_name, 'rb') as snapshot_file:
+            return cls(pickle.load(snapshot_file), network)
+
+    def restore(self, network=None, rng=None, streams=None, record_sink=None, statistics=None):
+        """
+        Returns a new Simulation continuing from the snapshot, with
+        network (by default the one the snapshot was taken from).
+
+        The random generators continue from their saved states, so every
+        restore sees the same numbers (common random numbers across
+        forks), unless rng or streams is given. A snapshot taken from the
+        global random module resets its state. Records and statistics
+        are copied from the snapshot unless record_sink or statistics is
+        given.
+        """
+        from simulation import Simulation
+        from sampling import BlockSampling
+
+        network = network if network is not None else self.network
+        if network is None:
+            raise ValueError("A loaded snapshot needs the network to restore.")
+        state = self.state
+        if (network.number_of_stations != state['number_of_stations']
+                or network.number_of_classes != state['number_of_classes']
+                or [station.number_of_servers for station in network.stations] != state['number_of_servers']):
+            raise ValueError("Network does not have the stations, classes and servers of the snapshot.")
+
+        saved_random = state['random']
+        restore_random = rng is None and streams is None
+        if restore_random:
+            if 'streams' in saved_random:
+                seed, antithetic, _ = saved_random['streams']
+                streams = RandomStreams(seed, antithetic)
+            elif not saved_random['rng'][0]:
+                rng = AntitheticRandom() if saved_random['rng'][1] else random.Random()
+        block_sampling = None
+        if 'block_sampling' in saved_random:
+            seed, block_size, _ = saved_random['block_sampling']
+            block_sampling = BlockSampling(seed, block_size)
+
+        if record_sink is None and state['records'] is not None:
+            record_sink = RecordStore()
+            record_sink.columns = [array(column.typecode, column) for column in state['records']]
+        if statistics is None:
+            statistics = copy.deepcopy(state['statistics'])
+
+        simulation = Simulation(network, recycle_patients=state['recycle_patients'],
+                                record_sink=record_sink, drop_exited_patients=not state['keep_patients'],
+                                rng=rng, streams=streams, block_sampling=block_sampling,
+                                statistics=statistics, time_weighted=state['time_weighted'],
+                                bucket_width=state['bucket_width'])
+        self.restore_state(simulation)
+        if restore_random:
+            self.restore_random(simulation)
+        if block_sampling is not None:
+            self.restore_blocks(simulation)
+        return simulation
+
+    def restore_state(self, simulation):
+        state = self.state
+        simulation.current_time = state['current_time']
+
+        patients = []
+        for values in state['patients']:
+            patient = Patient(0)
+            for field, value in zip(PATIENT_FIELDS, values):
+                setattr(patient, field, value)
+            patients.append(patient)
+
+        arrival_station = simulation.all_stations[0]
+        arrivals = state['arrivals']
+        arrival_station.number_of_patients = arrivals['number_of_patients']
+        arrival_station.number_of_accepted_patients = arrivals['number_of_accepted_patients']
+        arrival_station.event_dates_dict = copy.deepcopy(arrivals['event_dates_dict'])
+        arrival_station.rejection_dict = copy.deepcopy(arrivals['rejection_dict'])
+        arrival_station.arrival_scheduler.heap = list(arrivals['heap'])
+        arrival_station.find_next_event_date()
+
+        for station, saved in zip(simulation.transitive_stations, state['stations']):
+            station.number_of_patients = saved['number_of_patients']
+            station.next_event_date = saved['next_event_date']
+            if saved['server_utilization'] is not None:
+                station.server_utilization = saved['server_utilization']
+
+            queue = station.patients
+            queue.waiting = [deque(patients[i] for i in waiting) for waiting in saved['waiting']]
+            queue.in_service = {date: [patients[i] for i in in_service]
+                                for date, in_service in saved['in_service'].items()}
+            queue.keys = {patients[i]: key for i, key in saved['keys']}
+            queue.sequence = count(saved['sequence'])
+            if queue.track_completions:
+                queue.completion_dates = list(queue.in_service)
+                heapify(queue.completion_dates)
+
+            if saved['occupancy'] is not None:
+                station.occupancy = restore_time_weighted(saved['occupancy'])
+                station.busy_servers = (restore_time_weighted(saved['busy_servers'])
+                                        if saved['busy_servers'] is not None else station.occupancy)
+
+            if saved['servers'] is not None:
+                pool = station.server_pool
+                pool.free, pool.completions = [], []
+                for server, (values, patient, profile) in zip(station.servers, saved['servers']):
+                    for field, value in zip(SERVER_FIELDS, values):
+                        setattr(server, field, value)
+                    server.patient = patients[patient] if patient is not None else None
+                    server.busy_profile = restore_time_weighted(profile)
+                    if server.busy:
+                        server.patient.server = server
+                        pool.schedule_completion(server)
+                    else:
+                        pool.free.append((server.id_number, server))
+                heapify(pool.free)
+
+        exit_station = simulation.all_stations[-1]
+        exit_station.all_patients = [patients[i] for i in state['exited']]
+        exit_station.number_of_patients = state['number_exited']
+        simulation.patient_pool.free = [patients[i] for i in state['pool']]
+
+        simulation.event_calendar = EventCalendar(simulation.all_stations,
+                                                  simulation.random_stream('Ties'))
+
+    def restore_random(self, simulation):
+        saved = self.state['random']
+        if 'streams' in saved:
+            for key, stream_state in saved['streams'][2].items():
+                simulation.streams.stream(*key).setstate(stream_state)
+        else:
+            simulation.rng.setstate(saved['rng'][2])
+
+    def restore_blocks(self, simulation):
+        _, _, blocks = self.state['random']['block_sampling']
+        samplers = {'Arr': simulation.inter_arrival_times, 'Ser': simulation.service_times}
+        for (kind, station, clss), (generator_state, block) in blocks.items():
+            sampler = samplers[kind][station][clss]
+            sampler.generator.bit_generator.state = generator_state
+            sampler.block = list(block)
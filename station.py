@@ -1,14 +1,15 @@
 from __future__ import division
 
-from collections import namedtuple
-from random import random
 import os
 from csv import writer
 from math import isinf
-import pdb
 
-from utils import random_choice, flatten_list
-from individual import Server, Patient
+from utils import random_choice
+from individual import Server, NaN
+from server_pool import ServerPool
+from arrival_scheduler import ArrivalScheduler
+from patient_queue import PatientQueue
+from kpi import TimeWeighted
 
 class ArrivalStation(object):
     def __init__(self, simulation):
@@ -19,6 +20,7 @@ class ArrivalStation(object):
         self.event_dates_dict = {station + 1: {clss: False 
             for clss in range(self.simulation.network.number_of_classes)} 
             for station in range(self.simulation.network.number_of_stations)}
+        self.arrival_scheduler = ArrivalScheduler()
 
         self.initialize_event_dates_dict()
         # delete?
@@ -28,9 +30,7 @@ class ArrivalStation(object):
         self.find_next_event_date()
     
     def inter_arrival(self, station , clss, current_time):
-        if self.simulation.network.patients[clss].arrival_dist[station-1][0] == "TimeDependent":
-            return self.simulation.inter_arrival_times[station][clss](current_time)
-        return self.simulation.inter_arrival_times[station][clss]()
+        return self.simulation.inter_arrival_times[station][clss](current_time)
 
     def initialize_event_dates_dict(self):
         """
@@ -40,28 +40,19 @@ class ArrivalStation(object):
         for station in self.event_dates_dict:
             for clss in self.event_dates_dict[station]:
                 self.event_dates_dict[station][clss] = self.inter_arrival(station, clss, 0.0)
+                self.arrival_scheduler.schedule(self.event_dates_dict[station][clss], station, clss)
     
     def find_next_event_date(self):
         """
         Finds the time of the next arrival.
         """
-        times = [[self.event_dates_dict[station + 1][clss] 
-            for clss in range(len(self.event_dates_dict[1]))] 
-            for station in range(len(self.event_dates_dict))]
-
-        min_times = [min(obs) for obs in times]
-        station = min_times.index(min(min_times))
-        clss = times[station].index(min(times[station]))
-
-        self.next_station = station + 1
-        self.next_class = clss
-        self.next_event_date  = self.event_dates_dict[self.next_station][self.next_class]
+        self.next_event_date, self.next_station, self.next_class = self.arrival_scheduler.next_arrival()
 
     def record_rejection(self, next_station):
         """
         Adds a patient to the rejection dictionary
         """
-        self.rejection_dict[next_station.id_number][
+        self.rejection_dict[next_station.station_id][
             self.next_class].append(self.next_event_date)
 
     def send_patient(self, next_station, next_patient):
@@ -77,6 +68,8 @@ class ArrivalStation(object):
         """
         if next_station.number_of_patients >= next_station.station_capacity:
             self.record_rejection(next_station)
+            if self.simulation.recycle_patients:
+                self.simulation.patient_pool.recycle(next_patient)
         else:
             self.send_patient(next_station, next_patient) 
 
@@ -88,7 +81,7 @@ class ArrivalStation(object):
 
         priority_class = self.simulation.network.priority_cls_mapping[self.next_class]
         
-        next_patient = Patient(self.number_of_patients, self.next_class, priority_class)
+        next_patient = self.simulation.patient_pool.acquire(self.number_of_patients, self.next_class, priority_class)
         next_station = self.simulation.transitive_stations[self.next_station - 1]
         
         self.release_patient(next_station, next_patient)
@@ -96,6 +89,7 @@ class ArrivalStation(object):
         self.event_dates_dict[self.next_station][self.next_class] = self.increment_time(
             self.event_dates_dict[self.next_station][self.next_class], 
             self.inter_arrival(self.next_station, self.next_class, self.next_event_date))
+        self.arrival_scheduler.reschedule_next(self.event_dates_dict[self.next_station][self.next_class])
         self.find_next_event_date()
 
     def increment_time(self, original, increment):
@@ -116,53 +110,79 @@ class Station(object):
 
         self.class_change = station.class_change_matrix
 
+        self.routing_table = self.simulation.routing_tables[idx - 1]
+        self.class_change_table = self.simulation.class_change_tables[idx - 1]
+
+        self.routing_rngs = [self.simulation.random_stream('Route', idx, clss)
+            for clss in range(self.simulation.network.number_of_classes)]
+        self.class_change_rngs = [self.simulation.random_stream('ClassChange', idx, clss)
+            for clss in range(self.simulation.network.number_of_classes)]
+        self.tie_rng = self.simulation.random_stream('Ties')
+
         self.next_event_date = float("Inf")
 
         # servers
         if not isinf(self.number_of_servers):
             self.servers = [Server(self, i+1, 0.0) for i in range(self.number_of_servers)]
+            self.server_pool = ServerPool(self.servers)
         self.server_id_max = self.number_of_servers
         self.all_servers_total = []
         self.all_servers_busy = []
         # patients
-        self.patients = [[] for _ in range(simulation.priority_lev)]
+        self.patients = PatientQueue(simulation.priority_lev,
+            track_completions=isinf(self.number_of_servers))
         self.number_of_patients = 0
+        # time-weighted statistics
+        self.occupancy = None
+        self.busy_servers = None
+        if simulation.time_weighted:
+            self.occupancy = TimeWeighted(bucket_width=simulation.bucket_width)
+            if isinf(self.number_of_servers):
+                self.busy_servers = self.occupancy
+            else:
+                self.busy_servers = TimeWeighted(bucket_width=simulation.bucket_width)
+                for server in self.servers:
+                    server.busy_profile = TimeWeighted(bucket_width=simulation.bucket_width)
 
     @property
     def all_patients(self):
-        return flatten_list(self.patients)  
+        return self.patients.all_patients()
 
     def get_service_time(self, clss, current_time):
-        if self.simulation.network.patients[clss].service_dist[self.station_id-1][0] == 'TimeDependent':
-            return self.simulation.service_times[self.station_id][clss](current_time)
-        return self.simulation.service_times[self.station_id][clss]()
+        return self.simulation.service_times[self.station_id][clss](current_time)
 
     def free_server(self):
         if isinf(self.number_of_servers):
             return True
-        return len([server for server in self.servers if not server.busy]) > 0
+        return self.server_pool.has_free()
 
     def find_free_server(self):
-        for server in self.servers:
-            if not server.busy:
-                return server
+        return self.server_pool.acquire()
 
     def attach_server(self, server, patient):
         server.patient = patient
         server.busy = True
         patient.server = server
         server.next_end_service_date = patient.service_end_date
+        self.server_pool.schedule_completion(server)
+        if self.busy_servers is not None:
+            self.busy_servers.update(patient.service_start_date, self.busy_servers.value + 1)
+            server.busy_profile.update(patient.service_start_date, 1)
 
     def detatch_server(self, server, patient):
-        server.patient = False
+        server.patient = None
         server.busy = False
-        patient.server = False
+        server.next_end_service_date = float('Inf')
+        patient.server = None
+        self.server_pool.release(server)
 
-        if not server.busy_time:
-            server.busy_time = (patient.exit_date - patient.service_start_date)
-        else:
-            server.busy_time += (patient.exit_date - patient.service_start_date)
+        server.busy_time -= server.partial_busy_time
+        server.partial_busy_time = 0.0
+        server.busy_time += (patient.exit_date - patient.service_start_date)
         server.total_time = self.increment_time(patient.exit_date, - server.start_date)
+        if self.busy_servers is not None:
+            self.busy_servers.update(patient.exit_date, self.busy_servers.value - 1)
+            server.busy_profile.update(patient.exit_date, 0)
 
     def increment_time(self, original, increment):
         return original + increment
@@ -172,16 +192,15 @@ class Station(object):
         Takes patient and changes patient class
         according to a probability distribution.
         """
-        if self.class_change:
+        if self.class_change_table:
             patient.prev_class = patient.patient_class
-            patient.patient_class = random_choice(
-                range(self.simulation.network.number_of_classes),
-                self.class_change[patient.prev_class])
+            patient.patient_class = self.class_change_table[patient.prev_class].draw(
+                self.class_change_rngs[patient.prev_class])
             patient.prev_priority_class = patient.priority_class
             patient.priority_class = self.simulation.network.priority_cls_mapping[patient.patient_class]
 
     def have_event(self):
-        next_patient, next_patient_index = self.find_next_patient()
+        next_patient = self.find_next_patient()
 
         self.change_patient_class(next_patient)
 
@@ -191,37 +210,32 @@ class Station(object):
         if not isinf(self.number_of_servers):
             next_patient.server.next_end_service_date = float('Inf')
 
-        self.release(next_patient_index, next_station, self.next_event_date)
+        self.release(next_patient, next_station, self.next_event_date)
 
     def find_next_patient(self):
-        next_patient_indices = [i 
-            for i, ind in enumerate(self.all_patients) 
-            if ind.service_end_date == self.next_event_date]
+        next_patients = self.patients.completing(self.next_event_date)
 
-        if len(next_patient_indices) > 1:
-            next_patient_index = random_choice(next_patient_indices)
-        else:
-            next_patient_index = next_patient_indices[0]
-
-        return self.all_patients[next_patient_index], next_patient_index
+        if len(next_patients) > 1:
+            return random_choice(next_patients, rng=self.tie_rng)
+        return next_patients[0]
 
     def find_server_utilization(self):
         if isinf(self.number_of_servers) or self.number_of_servers == 0:
             self.server_utilization = None
         else:
-            for server in self.servers:
-                self.all_servers_total.append(server.total_time)
-                self.all_servers_busy.append(server.busy_time)
+            self.all_servers_total = [server.total_time for server in self.servers]
+            self.all_servers_busy = [server.busy_time for server in self.servers]
             self.server_utilization = sum(self.all_servers_busy) / sum(self.all_servers_total)
 
     def next_station(self, patient_class):
-        return random_choice(array = self.simulation.all_stations[1:], 
-            probs = self.transition_row[patient_class] + [1.0 - sum(self.transition_row[patient_class])])
+        return self.simulation.all_stations[1 + self.routing_table[patient_class].draw(
+            self.routing_rngs[patient_class])]
   
-    def release(self, next_patient_index, next_station, current_time):
-        next_patient =  self.all_patients[next_patient_index]
-        self.patients[next_patient.prev_priority_class].remove(next_patient)
+    def release(self, next_patient, next_station, current_time):
+        self.patients.remove(next_patient)
         self.number_of_patients -= 1
+        if self.occupancy is not None:
+            self.occupancy.update(current_time, self.number_of_patients)
         next_patient.queue_size_at_departure = self.number_of_patients
 
         next_patient.exit_date = current_time
@@ -231,6 +245,7 @@ class Station(object):
         
         self.write_patient_record(next_patient)
         self.begin_service_if_possible_release(current_time)
+        self.simulation.station_changed(self)
         next_station.accept(next_patient, current_time)
 
     def begin_service_if_possible_accept(self, next_patient, current_time):
@@ -242,68 +257,76 @@ class Station(object):
             next_patient.service_end_date = current_time + next_patient.service_time
             if not isinf(self.number_of_servers):
                 self.attach_server(self.find_free_server(), next_patient)
+            self.patients.serve(next_patient, next_patient.priority_class)
+        else:
+            self.patients.wait(next_patient, next_patient.priority_class)
 
     def begin_service_if_possible_release(self, current_time):
         if self.free_server() and (not isinf(self.number_of_servers)):
-            server = self.find_free_server()
-            inds_without_server = [i for i in self.all_patients if not i.server]
-            if len(inds_without_server) > 0:
-                ind = inds_without_server[0]
+            ind = self.patients.next_waiting()
+            if ind is not None:
                 ind.service_start_date = self.get_now(current_time)
                 ind.service_end_date = ind.service_start_date + ind.service_time
-                self.attach_server(server, ind)
+                self.attach_server(self.find_free_server(), ind)
+                self.patients.serve(ind)
 
     def get_now(self, current_time):
         return current_time
 
     def accept(self, next_patient, current_time):
-        next_patient.exit_date = False
+        next_patient.exit_date = NaN
         self.begin_service_if_possible_accept(next_patient, current_time)
         next_patient.queue_size_at_arrival = self.number_of_patients
-        self.patients[next_patient.priority_class].append(next_patient)
         self.number_of_patients += 1
+        if self.occupancy is not None:
+            self.occupancy.update(current_time, self.number_of_patients)
+        self.simulation.station_changed(self)
 
     def wrap_up_servers(self, current_time):
+        if self.occupancy is not None:
+            self.occupancy.advance(current_time)
+            self.busy_servers.advance(current_time)
         if not isinf(self.number_of_servers):
             for server in self.servers:
                 server.total_time = self.increment_time(current_time, -server.start_date)
+                server.busy_time -= server.partial_busy_time
+                server.partial_busy_time = 0.0
                 if server.busy:
-                    server.busy_time += self.increment_time(current_time, -server.patient.service_start_date)
+                    server.partial_busy_time = self.increment_time(current_time, -server.patient.service_start_date)
+                    server.busy_time += server.partial_busy_time
+                if server.busy_profile is not None:
+                    server.busy_profile.advance(current_time)
+
+    def time_averages(self):
+        """
+        Time-averaged number of patients present, waiting and in service,
+        and utilisation, over the run and per bucket (with bucket_width).
+        Utilisations are None for infinite-server stations.
+        """
+        finite = not isinf(self.number_of_servers) and self.number_of_servers > 0
+        patients = self.occupancy.bucket_means()
+        busy = self.busy_servers.bucket_means()
+        busy += [0.0] * (len(patients) - len(busy))
+        return {
+            'mean_patients': self.occupancy.mean(),
+            'mean_in_service': self.busy_servers.mean(),
+            'mean_waiting': self.occupancy.mean() - self.busy_servers.mean(),
+            'utilisation': self.busy_servers.mean() / self.number_of_servers if finite else None,
+            'server_utilisation': [server.busy_profile.mean() for server in self.servers] if finite else None,
+            'patients_by_bucket': patients,
+            'in_service_by_bucket': busy,
+            'waiting_by_bucket': [p - b for p, b in zip(patients, busy)],
+            'utilisation_by_bucket': [b / self.number_of_servers for b in busy] if finite else None,
+        }
 
     def update_next_event_date(self, current_time):
         if not isinf(self.number_of_servers):
-            next_end_service = min([server.next_end_service_date 
-                for server in self.servers] + [float("Inf")])
+            self.next_event_date = self.server_pool.next_completion_date()
         else:
-            next_end_service = min([pat.service_end_date 
-                for pat in self.all_patients
-                if not pat.is_blocked 
-                if pat.service_end_date >= current_time] + [float("Inf")])  
-
-        self.next_event_date = next_end_service
-
-
-    #     self.write_patient_record(next_patient)
-    #     self.begin_service_if_possible_release(current_time)
-    #     next_station.accept(next_patient, current_time)
-    #     self.release_blocked_patient(current_time)
+            self.next_event_date = self.patients.next_completion_date()
 
     def write_patient_record(self, patient):
-        DataRecord = namedtuple('Record', 
-                            ['id_number', 
-                                'patient_class', 
-                                'station',
-                                'arrival_date', 
-                                'waiting_time', 
-                                'service_start_date', 
-                                'service_time',
-                                'service_end_date', 
-                                'exit_date', 
-                                'destination',
-                                'queue_size_at_arrival', 
-                                'queue_size_at_departure'
-                                ])
-        record = DataRecord(
+        values = (
             patient.id_number,
             patient.prev_class,
             self.station_id,
@@ -316,21 +339,24 @@ class Station(object):
             patient.destination,
             patient.queue_size_at_arrival,
             patient.queue_size_at_departure)
-
-        patient.data_records.append(record)
-
-        patient.arrival_date = False
-        patient.service_time = False
-        patient.service_start_date = False
-        patient.service_end_date = False
-        patient.exit_date = False
-        patient.queue_size_at_arrival = False
-        patient.queue_size_at_departure = False
-        patient.destination = False
+        for record_writer in self.simulation.record_writers:
+            record_writer.append(*values)
+        patient.number_of_records += 1
+
+        patient.arrival_date = NaN
+        patient.service_time = NaN
+        patient.service_start_date = NaN
+        patient.service_end_date = NaN
+        patient.exit_date = NaN
+        patient.queue_size_at_arrival = None
+        patient.queue_size_at_departure = None
+        patient.destination = None
 
 class ExitStation(object):
 
-    def __init__(self):
+    def __init__(self, patient_pool=None, keep_patients=True):
+        self.patient_pool = patient_pool
+        self.keep_patients = keep_patients
         self.all_patients = []
         self.number_of_patients = 0
         self.station_id = -1
@@ -338,7 +364,10 @@ class ExitStation(object):
         self.station_capacity = float("Inf")
 
     def accept(self, next_patient, current_time):
-        self.all_patients.append(next_patient)
+        if self.patient_pool is not None:
+            self.patient_pool.recycle(next_patient)
+        elif self.keep_patients:
+            self.all_patients.append(next_patient)
         self.number_of_patients += 1
 
     def update_next_event_date(self):
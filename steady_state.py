@@ -0,0 +1,135 @@
+from __future__ import division
+
+from array import array
+from math import sqrt
+
+from records import RECORD_FIELDS
+
+# two-sided 95% Student t quantiles for 1..30 degrees of freedom
+T_975 = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+         2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+         2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+
+FIELD_INDEX = {field: i for i, (field, _) in enumerate(RECORD_FIELDS)}
+
+def t_quantile(df):
+    if df < 1:
+        return float('nan')
+    if df <= len(T_975):
+        return T_975[df - 1]
+    return 1.96
+
+def mser(series, batch_size=5):
+    """
+    MSER-m warm-up detection (MSER-5 by default): averages series in
+    batches of batch_size and returns the number of leading observations
+    to delete, the one minimising the marginal standard error of the
+    remaining batch means. Truncating more than half of the batches is
+    not considered.
+    """
+    k = len(series) // batch_size
+    if k < 2:
+        return 0
+    batches = [sum(series[j * batch_size:(j + 1) * batch_size]) / batch_size for j in range(k)]
+
+    # suffix sums, so every candidate costs O(1)
+    best, best_d = float('Inf'), 0
+    total = total_squares = 0.0
+    for d in range(k - 1, -1, -1):
+        total += batches[d]
+        total_squares += batches[d] * batches[d]
+        n = k - d
+        if d > k // 2:
+            continue
+        statistic = max(total_squares - total * total / n, 0.0) / (n * n)
+        if statistic <= best:
+            best, best_d = statistic, d
+    return best_d * batch_size
+
+def batch_means(series, number_of_batches=20):
+    """
+    Returns (mean, half_width) of a 95% batch means confidence interval
+    on the mean of series. The first len(series) % number_of_batches
+    observations are left out so that batches are of equal size.
+    """
+    size = len(series) // number_of_batches
+    if size == 0:
+        return float('nan'), float('nan')
+    start = len(series) - size * number_of_batches
+    means = [sum(series[start + j * size:start + (j + 1) * size]) / size
+             for j in range(number_of_batches)]
+    mean = sum(means) / number_of_batches
+    sd = sqrt(sum((m - mean) ** 2 for m in means) / (number_of_batches - 1))
+    return mean, t_quantile(number_of_batches - 1) * sd / sqrt(number_of_batches)
+
+class ObservationSeries(object):
+    """
+    Record sink keeping, in completion order, the values of some record
+    fields ('sojourn_time' meaning exit_date - arrival_date) for the
+    records of station (all stations when None), with their exit dates.
+    """
+
+    def __init__(self, fields, station=None):
+        self.fields = list(fields)
+        for field in self.fields:
+            if field != 'sojourn_time' and field not in FIELD_INDEX:
+                raise ValueError("Unknown record field %r." % (field,))
+        self.station = station
+        self.values = {field: array('d') for field in self.fields}
+        self.exit_dates = array('d')
+
+    def __len__(self):
+        return len(self.exit_dates)
+
+    def append(self, *record):
+        if self.station is not None and record[FIELD_INDEX['station']] != self.station:
+            return
+        for field in self.fields:
+            if field == 'sojourn_time':
+                value = record[FIELD_INDEX['exit_date']] - record[FIELD_INDEX['arrival_date']]
+            else:
+                value = record[FIELD_INDEX[field]]
+            self.values[field].append(value)
+        self.exit_dates.append(record[FIELD_INDEX['exit_date']])
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+class PrecisionResult(object):
+    """
+    Outcome of Simulation.simulate_until_precision: whether every field
+    reached the requested precision, the date the run stopped at, the
+    warm-up detected (in observations and as the exit date of the last
+    deleted observation) and {field: {'mean', 'half_width',
+    'relative_half_width'}} over the observations kept.
+    """
+
+    def __init__(self, converged, end_date, warmup_observations, warmup_date,
+                 observations, estimates):
+        self.converged = converged
+        self.end_date = end_date
+        self.warmup_observations = warmup_observations
+        self.warmup_date = warmup_date
+        self.observations = observations
+        self.estimates = estimates
+
+def precision(series, relative_half_width, number_of_batches=20, min_batch_size=10):
+    """
+    Deletes the longest MSER-5 warm-up of the fields of series and
+    returns (converged, warmup, estimates). The series has not converged
+    while fewer than number_of_batches * min_batch_size observations
+    remain or any relative half-width is above relative_half_width.
+    """
+    warmup = max(mser(series.values[field]) for field in series.fields)
+    converged = len(series) - warmup >= number_of_batches * min_batch_size
+    estimates = {}
+    for field in series.fields:
+        mean, half_width = batch_means(series.values[field][warmup:], number_of_batches)
+        relative = half_width / abs(mean) if mean else (0.0 if half_width == 0 else float('Inf'))
+        estimates[field] = {'mean': mean, 'half_width': half_width, 'relative_half_width': relative}
+        if not relative <= relative_half_width:
+            converged = False
+    return converged, warmup, estimates
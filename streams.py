@@ -0,0 +1,37 @@
+from __future__ import division
+
+import random
+
+class AntitheticRandom(random.Random):
+    """
+    random.Random whose uniforms are mirrored, u -> 1 - u. Every
+    distribution built on random() (expovariate, uniform, normalvariate,
+    random_choice, ...) then yields the antithetic counterpart of the
+    stream seeded the same way.
+    """
+
+    def random(self):
+        u = super(AntitheticRandom, self).random()
+        return 1.0 - u if u > 0.0 else 0.0
+
+class RandomStreams(object):
+    """
+    One independent random.Random per source of randomness, keyed e.g.
+    ('Arr', station, clss), ('Ser', station, clss), ('Route', station,
+    clss), ('ClassChange', station, clss) or ('Ties',).
+
+    A stream is seeded from the string "seed:key", so the same source
+    sees the same numbers in every configuration run with the same seed
+    (common random numbers), whatever the other sources consume.
+    """
+
+    def __init__(self, seed=0, antithetic=False):
+        self.seed = seed
+        self.antithetic = antithetic
+        self.streams = {}
+
+    def stream(self, *key):
+        if key not in self.streams:
+            generator = AntitheticRandom if self.antithetic else random.Random
+            self.streams[key] = generator('%s:%s' % (self.seed, ':'.join(str(k) for k in key)))
+        return self.streams[key]
@@ -0,0 +1,182 @@
+from __future__ import division
+
+from csv import writer
+from itertools import product
+
+from params_to_network import create_network
+from replication import default_metrics, run_stream_replication, run_tasks, summarise, cached_tasks
+
+def expand_grid(grid):
+    """
+    Turns {parameter: [values]} into the list of override dicts of
+    every combination, the last parameter varying fastest.
+    """
+    names = list(grid)
+    return [dict(zip(names, values)) for values in product(*[grid[name] for name in names])]
+
+def configurations(base, grid=None, overrides=None):
+    """
+    Returns the create_network parameter dicts of a sweep: base updated
+    with each override of grid (see expand_grid) and of the list
+    overrides, or base alone.
+    """
+    changes = (expand_grid(grid) if grid else []) + list(overrides or [])
+    if not changes:
+        changes = [{}]
+    configs = []
+    for change in changes:
+        params = dict(base)
+        params.update(change)
+        configs.append((change, params))
+    return configs
+
+class SweepResults(object):
+    """
+    Results of a sweep, one configuration per override.
+
+    results[j] lists the metrics of the replications configuration j
+    ran, in index order, and summaries[j] pools them. dropped maps the
+    configurations dropped as dominated to the replications they ran.
+    """
+
+    def __init__(self, overrides, results, dropped, objective=None):
+        self.overrides = overrides
+        self.results = results
+        self.dropped = dropped
+        self.objective = objective
+        self.summaries = [summarise(config_results) for config_results in results]
+        self.parameters = sorted(set(name for override in overrides for name in override))
+
+    def rows(self):
+        """
+        One row per replication: configuration, swept parameters,
+        replication index and metrics.
+        """
+        rows = []
+        for config, (override, config_results) in enumerate(zip(self.overrides, self.results)):
+            for index, metrics in enumerate(config_results):
+                row = {'configuration': config, 'replication': index}
+                row.update((name, override.get(name)) for name in self.parameters)
+                row.update(metrics)
+                rows.append(row)
+        return rows
+
+    def table(self):
+        """
+        Tidy summary: one row per configuration and metric, with the
+        swept parameters, n, mean, sd, half_width and whether the
+        configuration was dropped.
+        """
+        rows = []
+        for config, (override, summary) in enumerate(zip(self.overrides, self.summaries)):
+            for metric in sorted(summary):
+                row = {'configuration': config}
+                row.update((name, override.get(name)) for name in self.parameters)
+                row['metric'] = metric
+                row.update(summary[metric])
+                row['dropped'] = config in self.dropped
+                rows.append(row)
+        return rows
+
+    def write_csv(self, file_name):
+        rows = self.table()
+        headers = (['configuration'] + self.parameters
+                   + ['metric', 'n', 'mean', 'sd', 'half_width', 'dropped'])
+        with open(file_name, 'w', newline='') as data_file:
+            csv_wrtr = writer(data_file)
+            csv_wrtr.writerow(headers)
+            for row in rows:
+                csv_wrtr.writerow([row[header] for header in headers])
+
+    def best(self, minimise=True):
+        """
+        Index of the configuration with the best mean objective.
+        """
+        means = [summary[self.objective]['mean'] for summary in self.summaries]
+        sign = 1 if minimise else -1
+        return min(range(len(means)), key=lambda config: sign * means[config])
+
+def dominated(summaries, active, objective, minimise=True):
+    """
+    Returns the active configurations whose objective confidence
+    interval lies entirely on the wrong side of the best one's.
+    """
+    sign = 1 if minimise else -1
+    bounds = {}
+    for config in active:
+        statistics = summaries[config].get(objective)
+        if statistics is None or statistics['n'] < 2:
+            return []
+        mean = sign * statistics['mean']
+        bounds[config] = (mean - statistics['half_width'], mean + statistics['half_width'])
+    best_upper = min(upper for _, upper in bounds.values())
+    return [config for config in active if bounds[config][0] > best_upper]
+
+def sweep(base, max_simulation_time, replications, grid=None, overrides=None, seed=0,
+          processes=None, metrics=default_metrics, objective=None, minimise=True,
+          first_round=None, round_size=None, cache=None):
+    """
+    Replicates every configuration of base (see configurations) up to
+    max_simulation_time and returns a SweepResults.
+
+    Replication i of every configuration uses the same per-source
+    RandomStreams, so configurations are compared on common random
+    numbers. All replications of a round run over one process pool.
+
+    With objective (a metric name), replications run in rounds: first
+    first_round of them, then round_size more at a time. After each
+    round, configurations whose 95% interval on the objective is worse
+    than the best configuration's (smaller when minimise) are dropped
+    and run no further replications.
+
+    With cache (a ResultCache), replications already cached are read
+    back and only the missing ones are run, then cached. Configurations
+    the cache cannot key are run without it.
+    """
+    configs = configurations(base, grid, overrides)
+    networks = [create_network(**params) for _, params in configs]
+
+    if objective is None:
+        rounds = [replications]
+    else:
+        first_round = first_round or max(2, replications // 4)
+        round_size = round_size or first_round
+        rounds = [min(first_round, replications)]
+        while sum(rounds) < replications:
+            rounds.append(min(round_size, replications - sum(rounds)))
+
+    results = [[] for _ in configs]
+    dropped = {}
+    active = list(range(len(configs)))
+    done = 0
+    for size in rounds:
+        tasks = [((config, index), networks[config], max_simulation_time,
+                  '%s:%d' % (seed, index), False, metrics, None)
+                 for config in active for index in range(done, done + size)]
+        round_results = {}
+        keys = {}
+        if cache is not None:
+            for task in tasks:
+                try:
+                    keys[task[0]] = cache.key(task[1], max_simulation_time, ('streams', task[3], False), metrics)
+                except ValueError:
+                    pass
+            keyed = [task for task in tasks if task[0] in keys]
+            hits, keyed = cached_tasks(cache, keyed, [keys[task[0]] for task in keyed])
+            round_results.update((task[0], result) for task, result in hits)
+            tasks = keyed + [task for task in tasks if task[0] not in keys]
+        for key, result in run_tasks(run_stream_replication, tasks, processes):
+            round_results[key] = result
+            if key in keys:
+                cache.put(keys[key], result)
+        for config in active:
+            results[config].extend(round_results[config, index] for index in range(done, done + size))
+        done += size
+
+        if objective is not None and done < replications:
+            summaries = {config: summarise(results[config]) for config in active}
+            for config in dominated(summaries, active, objective, minimise):
+                dropped[config] = done
+                active.remove(config)
+
+    return SweepResults([change for change, _ in configs], results, dropped, objective)
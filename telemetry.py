@@ -0,0 +1,126 @@
+from __future__ import division
+
+import os
+import json
+from time import perf_counter
+
+def memory_in_use():
+    """
+    Resident memory of this process in bytes: current on Linux, peak
+    elsewhere where resource is available, otherwise None.
+    """
+    try:
+        with open('/proc/self/statm', 'r') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except ImportError:
+        return None
+
+class Telemetry(object):
+    """
+    Sampled progress reports of a run, published to callback (called
+    with each sample dict), logger (a logging.Logger, at INFO) and/or
+    file_name (one JSON object per line).
+
+    The event loop only counts events down; every poll events (every
+    `every` events when that is given) it hands over to tick, which
+    publishes when interval wall-clock seconds have passed since the
+    last sample (or at every tick with `every`). A final sample is
+    published when the run ends.
+
+    A sample holds the wall and simulated time, the events so far and
+    the events per second since the previous sample, the number of
+    patients at each station, the records written and the memory in use.
+    """
+
+    def __init__(self, callback=None, logger=None, file_name=None,
+                 interval=1.0, every=None, poll=1024):
+        self.callback = callback
+        self.logger = logger
+        self.file_name = file_name
+        self.interval = interval
+        self.every = every
+        self.stride = every if every is not None else poll
+        self.samples = 0
+
+    def start(self, simulation, current_time):
+        """
+        Called before the first event; returns the stride.
+        """
+        self.simulation = simulation
+        self.events = 0
+        self.start_wall = self.last_wall = perf_counter()
+        self.last_events = 0
+        self.output = open(self.file_name, 'a') if self.file_name is not None else None
+        return self.stride
+
+    def tick(self, current_time):
+        """
+        Called after every stride events; returns the next stride.
+        """
+        self.events += self.stride
+        now = perf_counter()
+        if self.every is not None or now - self.last_wall >= self.interval:
+            self.publish(current_time, now)
+        return self.stride
+
+    def finish(self, current_time, countdown):
+        """
+        Called when the run ends, countdown events short of a tick.
+        """
+        self.events += self.stride - countdown
+        self.publish(current_time, perf_counter(), final=True)
+        if self.output is not None:
+            self.output.close()
+            self.output = None
+
+    def sample(self, current_time, now, final=False):
+        elapsed = now - self.last_wall
+        records = self.simulation.records
+        return {
+            'wall_time': now - self.start_wall,
+            'simulation_time': current_time,
+            'events': self.events,
+            'events_per_second': (self.events - self.last_events) / elapsed if elapsed > 0 else float('nan'),
+            'queue_sizes': {station.station_id: station.number_of_patients
+                            for station in self.simulation.transitive_stations},
+            'records': len(records) if hasattr(records, '__len__') else None,
+            'memory': memory_in_use(),
+            'final': final,
+        }
+
+    def publish(self, current_time, now, final=False):
+        sample = self.sample(current_time, now, final)
+        self.samples += 1
+        self.last_wall, self.last_events = now, self.events
+        if self.callback is not None:
+            self.callback(sample)
+        if self.logger is not None:
+            self.logger.info('t=%.6g events=%d (%.0f/s) patients=%s memory=%s',
+                             sample['simulation_time'], sample['events'], sample['events_per_second'],
+                             sample['queue_sizes'], sample['memory'])
+        if self.output is not None:
+            self.output.write(json.dumps(sample) + '\n')
+            self.output.flush()
+
+class ProgressBar(object):
+    """
+    Telemetry callback moving a tqdm bar over simulated time.
+    """
+
+    def __init__(self, max_simulation_time):
+        import tqdm
+        self.max_simulation_time = max_simulation_time
+        self.bar = tqdm.tqdm(total=max_simulation_time)
+
+    def __call__(self, sample):
+        position = sample['simulation_time'] if not sample['final'] else self.max_simulation_time
+        self.bar.update(max(min(position, self.max_simulation_time) - self.bar.n, 0))
+        if sample['final']:
+            self.bar.close()
@@ -3,15 +3,16 @@ import random
 def seed(z):
 	random.seed(z)
 
-def random_choice(array, probs=None):
+def random_choice(array, probs=None, rng=random):
 	"""
 	This function takes in an array of values to make a choice from,
 	and an pdf corresponding to those values. It returns a random choice
-	from that array, using the probs as weights.
+	from that array, using the probs as weights. Draws come from rng,
+	the global random module unless a random.Random instance is given.
 	"""
 	# If no pdf provided, assume uniform dist:
 	if probs == None:
-		index = int(random.random() * len(array))
+		index = int(rng.random() * len(array))
 		return array[index]
 
 	# A common case, guaranteed to reach the Exit node;
@@ -20,23 +21,23 @@ def random_choice(array, probs=None):
 		return array[-1]
 
 	# Sample a random value from using pdf
-	rdm_num = random.random()
+	rdm_num = rng.random()
 	i, p = 0, probs[0]
 	while rdm_num > p:
 		i += 1
 		p += probs[i]
 	return array[i]
 
-def truncated_normal(mean, sd):
+def truncated_normal(mean, sd, rng=random):
 	"""
 	Sample from a Normal distribution, with mean and standard
 	deviation (sd). This truncated the distribution at 0 (lower bound
 	of 0). If samples less than 0 are sampled, they are resampled
     until a positive value is sampled.
 	"""
-	sample = random.normalvariate(mean, sd)
+	sample = rng.normalvariate(mean, sd)
 	while sample <= 0.0:
-		sample = random.normalvariate(mean, sd)
+		sample = rng.normalvariate(mean, sd)
 	return sample
 
 def flatten_list(list_of_lists):